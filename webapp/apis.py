@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import json
+import base64
 import logging
 import inspect
 import functools
@@ -57,6 +58,99 @@ class Page(object):
 
     __repr__ = __str__
 
+class CursorPage(object):
+    """
+    Keyset page object, seeks from an opaque cursor instead of counting and skipping rows.
+    """
+
+    def __init__(self, cursor=None, page_size=8, seek=("created_at", "id"), before=None):
+        """
+        Init Pagination by cursor token (or the before token of a previous link), page_size and the seek columns.
+        >>> p1 = CursorPage()
+        >>> p1.after, p1.limit, p1.has_previous
+        (None, 9, False)
+        >>> rows = [dict(created_at=float(10 - i), id=str(i)) for i in range(9)]
+        >>> p1.trim(rows)[-1]
+        {'created_at': 3.0, 'id': '7'}
+        >>> p1.has_next
+        True
+        >>> p2 = CursorPage(p1.next_cursor)
+        >>> p2.after
+        [3.0, '7']
+        >>> p2.trim(rows[8:])
+        [{'created_at': 2.0, 'id': '8'}]
+        >>> p2.has_next, p2.next_cursor
+        (False, None)
+        >>> p3 = CursorPage(before=p2.previous_cursor)
+        >>> p3.start, p3.desc
+        ([2.0, '8'], False)
+        >>> [r['id'] for r in p3.trim(rows[7::-1])]
+        ['0', '1', '2', '3', '4', '5', '6', '7']
+        >>> p3.has_previous, p3.has_next
+        (False, True)
+        >>> CursorPage(encode_cursor([1.0]))  # doctest: +IGNORE_EXCEPTION_DETAIL
+        Traceback (most recent call last):
+            ...
+        APIValueError: Invalid cursor.
+        >>> CursorPage(encode_cursor([{}, '7']))  # doctest: +IGNORE_EXCEPTION_DETAIL
+        Traceback (most recent call last):
+            ...
+        APIValueError: Invalid cursor.
+        """
+
+        self.page_size = page_size
+        self.seek = seek
+        self.cursor = cursor or None
+        self.after = decode_cursor(cursor, len(seek)) if cursor else None
+        # 上一页：从本页第一行开始按相反的顺序读取，取到后再倒过来
+        self.before = decode_cursor(before, len(seek)) if before and not cursor else None
+        self.desc = self.before is None
+        self.start = self.after if self.desc else self.before
+        # 多取一条，用来判断是否还有下一页(向前翻时是上一页)，从而不再需要count(id)
+        self.limit = page_size + 1
+        self.has_previous = self.after is not None
+        self.has_next = self.before is not None
+        self.next_cursor = None
+        self.previous_cursor = None
+
+    def trim(self, items):
+        more = len(items) > self.page_size
+        items = items[:self.page_size]
+        if self.desc:
+            self.has_next = more
+        else:
+            items = items[::-1]
+            self.has_previous = more
+        if items:
+            if self.has_next:
+                self.next_cursor = encode_cursor([items[-1][k] for k in self.seek])
+            if self.has_previous:
+                self.previous_cursor = encode_cursor([items[0][k] for k in self.seek])
+        return items
+
+    def __str__(self):
+        return f"cursor: {self.cursor}, page_size: {self.page_size}, has_next: {self.has_next}, " \
+               f"next_cursor: {self.next_cursor}, has_previous: {self.has_previous}, " \
+               f"previous_cursor: {self.previous_cursor}"
+
+    __repr__ = __str__
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token, size=None):
+    # cursor来自客户端：必须是size个字符串或数字，否则不能交给数据库驱动
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode('utf-8'))
+    except ValueError:
+        raise APIValueError('cursor', 'Invalid cursor.')
+    if not isinstance(values, list) or (size is not None and len(values) != size):
+        raise APIValueError('cursor', 'Invalid cursor.')
+    for v in values:
+        if isinstance(v, bool) or not isinstance(v, (str, int, float)):
+            raise APIValueError('cursor', 'Invalid cursor.')
+    return values
+
 class APIError(Exception):
     """
     the base APIError which contains error(required), data(optional) and message(optional).
@@ -1,33 +1,33 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import logging
-from logging.handlers import RotatingFileHandler
 import asyncio
 import os
 import time
 from datetime import datetime
-import json
 from aiohttp import web
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
 
 from config import configs
 import orm
+import assets
+import logconfig
+import metrics
+import compression
+import pagecache
+import serializer
+import sessioncache
 from coroweb import add_routes, add_static
 from handlers import cookie2user, COOKIE_NAME
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
-log_path = os.path.dirname(os.getcwd()) + '/logs/'
-log_name = log_path + 'log'
-fh = RotatingFileHandler(log_name, maxBytes=1024 * 1024 * 100, backupCount=10)
-fh.setLevel(logging.DEBUG)
-formatter = logging.Formatter("%(asctime)s - %(filename)s[line:%(lineno)d] - %(levelname)s: %(message)s")
-fh.setFormatter(formatter)
-logger.addHandler(fh)
+# 每个请求都会产生的日志，级别与采样率由configs.logging.categories控制
+request_log = logging.getLogger('http.request')
 
 
 def init_jinja2(app, **kw):
     logging.info('init jinja2...')
+    # 生产模式：启动时编译全部模板，关闭修改检查，编译结果存入字节码缓存供重启后复用
+    production = kw.get('production', False)
     options = dict(
         # 自动转义xml/html的特殊字符
         autoescape=kw.get('autoescape', True),
@@ -38,8 +38,15 @@ def init_jinja2(app, **kw):
         variable_start_string=kw.get('variable_start_string', '{{'),
         variable_end_string=kw.get('variable_end_string', '}}'),
         # 自动加载修改后的模板文件
-        auto_reload=kw.get('auto_reload', True)
+        auto_reload=kw.get('auto_reload', not production)
     )
+    if production:
+        # 模板数量有限，全部常驻内存
+        options['cache_size'] = -1
+        bytecode_cache = kw.get('bytecode_cache', None)
+        if bytecode_cache:
+            os.makedirs(bytecode_cache, exist_ok=True)
+        options['bytecode_cache'] = FileSystemBytecodeCache(bytecode_cache)
     # 获取模板文件夹路径
     path = kw.get('path', None)
     if path is None:
@@ -54,6 +61,14 @@ def init_jinja2(app, **kw):
         for name, f in filters.items():
             # filters是Environment类的属性：过滤器字典
             env.filters[name] = f
+    # 静态文件地址，启用指纹时返回带内容哈希的文件名
+    env.globals['static_url'] = assets.static_url
+    if production:
+        start = time.perf_counter()
+        names = env.list_templates(filter_func=lambda name: name.endswith('.html'))
+        for name in names:
+            env.get_template(name)
+        logging.info('compiled %d templates in %.1fms' % (len(names), (time.perf_counter() - start) * 1000))
     # 所有的一切是为了给app添加__templating__字段
     # 前面将jinja2的环境配置都赋值给env了，这里再把env存入app的dict中，这样app就知道要到哪儿去找模板，怎么解析模板
     app['__templating__'] = env
@@ -63,43 +78,118 @@ def init_jinja2(app, **kw):
 # URL处理日志工厂
 async def logger_factory(app, handler):
     async def logger_middleware(request):
-        logging.info(f"Request: {request.method} {request.path}")
+        request_log.info('Request: %s %s', request.method, request.path)
         return await handler(request)
     return logger_middleware
 
+# 请求级identity map：同一请求内按主键重复加载的行直接复用，结束时记录省下的查询数
+async def identity_factory(app, handler):
+    async def identity(request):
+        token = orm.begin_identity_map()
+        try:
+            return await handler(request)
+        finally:
+            imap = orm.end_identity_map(token)
+            request['identity_map'] = imap
+            if imap.saved:
+                request_log.info('identity map: %d queries, %d saved', imap.queries, imap.saved)
+    return identity
+
 # 认证处理工厂--把当前用户绑定到request上，并对URL/manage/进行拦截，检查当前用户是否是管理员身份
 async def auth_factory(app, handler):
     async def auth(request):
-        logging.info('check user: %s %s' % (request.method, request.path))
+        request_log.info('check user: %s %s', request.method, request.path)
         request.__user__ = None
         cookie_str = request.cookies.get(COOKIE_NAME)
         if cookie_str:
             user = await cookie2user(cookie_str)
             if user:
-                logging.info('set current user: %s' % user.email)
+                request_log.info('set current user: %s', user.email)
                 request.__user__ = user
+                orm.bind_session(user.id)
         if request.path.startswith('/manage/') and (request.__user__ is None or not request.__user__.admin):
             return web.HTTPFound('/signin')
         return await handler(request)
     return auth
 
+# 可缓存的页面(路由 -> 失效标签)，只缓存匿名用户的GET请求
+PAGE_CACHE_ROUTES = {
+    '/': lambda match: ('blogs',),
+    '/blog/{id}': lambda match: ('blog:%s' % match['id'],),
+}
+
+# 页面输出缓存工厂--匿名访问时直接返回缓存的页面，并用ETag回应If-None-Match
+# 缓存的是压缩后的页面，因此按协商出的编码分别缓存
+async def output_cache_factory(app, handler):
+    async def output_cache(request):
+        if request.method != 'GET' or request.__user__ is not None:
+            return await handler(request)
+        resource = request.match_info.route.resource
+        tags = PAGE_CACHE_ROUTES.get(resource.canonical) if resource is not None else None
+        if tags is None:
+            return await handler(request)
+        cache = pagecache.page_cache
+        compressor = compression.compressor
+        encoding = compressor.negotiate(request.headers.get('Accept-Encoding')) if compressor is not None else None
+        key = (request.path_qs, encoding)
+        inm = request.headers.get('If-None-Match')
+        entry = cache.get(key)
+        if entry is None:
+            # 渲染期间若有写入使标签失效，渲染结果可能是写入前的页面，不缓存
+            tags = tags(request.match_info)
+            generation = cache.generation(tags)
+            resp = await handler(request)
+            # 只缓存完整的200响应，设置cookie的响应不缓存
+            if type(resp) is not web.Response or resp.status != 200 or resp.cookies or not isinstance(resp.body, bytes):
+                return resp
+            entry = cache.put(key, resp.body, resp.content_type, resp.charset, tags,
+                              resp.headers.get('Content-Encoding'), generation)
+            if entry is None:
+                return resp
+            if not pagecache.etag_matches(inm, entry.etag):
+                resp.headers['ETag'] = entry.etag
+                resp.headers['X-Cache'] = 'MISS'
+                return resp
+        headers = {'ETag': entry.etag}
+        if compressor is not None:
+            headers['Vary'] = 'Accept-Encoding'
+        if pagecache.etag_matches(inm, entry.etag):
+            return web.Response(status=304, headers=headers)
+        if entry.encoding:
+            headers['Content-Encoding'] = entry.encoding
+        headers['X-Cache'] = 'HIT'
+        return web.Response(body=entry.body, content_type=entry.content_type, charset=entry.charset, headers=headers)
+    return output_cache
+
+# 响应压缩工厂--按Accept-Encoding压缩response_factory生成的HTML与JSON
+async def compression_factory(app, handler):
+    async def compress(request):
+        resp = await handler(request)
+        compressor = compression.compressor
+        if compressor is None:
+            return resp
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else 'unmatched'
+        return await compressor.apply(request, resp, route)
+    return compress
+
 # 数据处理工厂
 async def data_factory(app, handler):
     async def parse_data(request):
         if request.method == 'POST':
             if request.content_type.startswith('application/json'):
                 request.__data__ = await request.json()
-                logging.info('request json: %s' % str(request.__data__))
+                request_log.info('request json: %s', request.__data__)
             elif request.content_type.startswith('application/x-www-form-urlencoded'):
                 request.__data__ = await request.post()
-                logging.info('request form: %s' % str(request.__data__))
+                request_log.info('request form: %s', request.__data__)
         return await handler(request)
     return parse_data
 
 # 响应返回处理工厂
 async def response_factory(app, handler):
     async def response(request):
-        logging.info('Response handler...')
+        request_log.info('Response handler...')
         r = await handler(request)
         if isinstance(r, web.StreamResponse):
             return r
@@ -116,7 +206,9 @@ async def response_factory(app, handler):
         if isinstance(r, dict):
             template = r.get('__template__')
             if template is None:
-                resp = web.Response(body=json.dumps(r, ensure_ascii=False, default=lambda o: o.__dict__).encode('utf-8'))
+                if serializer.should_stream(r):
+                    return await stream_json(request, r)
+                resp = web.Response(body=serializer.dumps(r))
                 resp.content_type = 'application/json;charset=utf-8'
                 return resp
             else:
@@ -137,6 +229,20 @@ async def response_factory(app, handler):
     return response
 
 
+# 很长的列表以chunked方式分块编码、写出，不在内存中生成完整的响应体
+async def stream_json(request, r):
+    resp = web.StreamResponse()
+    resp.content_type = 'application/json'
+    resp.charset = 'utf-8'
+    resp.enable_chunked_encoding()
+    resp.enable_compression()
+    await resp.prepare(request)
+    for chunk in serializer.iter_chunks(r):
+        await resp.write(chunk)
+    await resp.write_eof()
+    return resp
+
+
 # 时间转换
 def datetime_filter(t):
     delta = int(time.time() - t)
@@ -152,13 +258,25 @@ def datetime_filter(t):
     return f"{dt.year}年{dt.month}月{dt.day}日"
 
 
+async def init_app(loop, db=None, pool_factory=None):
+    # 创建连接池并组装app，单进程的init与多进程的server.py共用；db用于覆盖configs.db
+    await orm.create_pool(loop=loop, pool_factory=pool_factory, **(db or configs.db))
+    pagecache.configure(**configs.page_cache)
+    compression.configure(**(configs.compression or {}))
+    sessioncache.configure(**(configs.session.cache or {}))
+    metrics.configure(**configs.metrics)
+    logging.info('json serializer: %s' % serializer.backend)
+    manifest = assets.init_assets(configs.static.build_dir) if configs.static.fingerprint else None
+    app = web.Application(middlewares=[logger_factory, identity_factory, auth_factory, output_cache_factory, compression_factory, response_factory])  # loop参数已弃用
+    init_jinja2(app, filters=dict(datetime=datetime_filter), **configs.templates)
+    add_routes(app, 'handlers')
+    add_static(app, manifest)
+    return app
+
+
 async def init(loop):
     # 新版本写法
-    await orm.create_pool(loop=loop, **configs.db)
-    app = web.Application(middlewares=[logger_factory, auth_factory, response_factory])  # loop参数已弃用
-    init_jinja2(app, filters=dict(datetime=datetime_filter))
-    add_routes(app, 'handlers')
-    add_static(app)
+    app = await init_app(loop)
 
     # srv = await loop.create_server(app.make_handler(), '127.0.0.1', 9000)
     # logging.info('server started at http://127.0.0.1:9000...')
@@ -166,12 +284,16 @@ async def init(loop):
 
     runner = web.AppRunner(app)
     await runner.setup()
-    site = web.TCPSite(runner, "127.0.0.1", 9000)
-    logging.info("server started at http://127.0.0.1:9000...")
+    host, port = configs.server.host, configs.server.port
+    site = web.TCPSite(runner, host, port)
+    logging.info("server started at http://%s:%s..." % (host, port))
     await site.start()
 
 
+# 单进程运行，多进程使用python server.py
 if __name__ == '__main__':
+    # 日志在后台线程中格式化并写入文件，不阻塞事件循环
+    logconfig.setup(**configs.logging)
     loop = asyncio.get_event_loop()
     loop.run_until_complete(init(loop))
     loop.run_forever()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Static asset pipeline: content-hashed file names, precompressed gzip/brotli variants
+and a static_url() template helper.
+
+    python assets.py          build the fingerprinted, precompressed files ahead of deploy
+"""
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import time
+
+from aiohttp import web
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('.js', '.css', '.html', '.svg', '.json', '.txt', '.map', '.xml')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, no-cache'
+
+
+def accepted_encodings(header):
+    # 解析Accept-Encoding，忽略q=0的编码
+    encodings = set()
+    for part in (header or '').split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        encodings.add(token)
+    return encodings
+
+
+class Asset(object):
+
+    __slots__ = ('path', 'name', 'content_type', 'etag', 'variants')
+
+    def __init__(self, path, name, content_type, etag, variants):
+        self.path = path  # 相对static目录的原始路径，如js/vue.min.js
+        self.name = name  # 带指纹的路径，如js/vue.min.3f2a9c1d0b7e.js
+        self.content_type = content_type
+        self.etag = etag
+        self.variants = variants  # 编码 -> 内容，identity为原始内容
+
+    def response(self, request, immutable):
+        encodings = accepted_encodings(request.headers.get('Accept-Encoding'))
+        encoding = 'identity'
+        for candidate in ('br', 'gzip'):
+            if candidate in encodings and candidate in self.variants:
+                encoding = candidate
+                break
+        etag = self.etag if encoding == 'identity' else '"%s-%s"' % (self.etag.strip('"'), encoding)
+        headers = {
+            'ETag': etag,
+            'Cache-Control': IMMUTABLE if immutable else REVALIDATE,
+            'Vary': 'Accept-Encoding',
+        }
+        inm = request.headers.get('If-None-Match')
+        if inm and etag in (t.strip() for t in inm.split(',')):
+            return web.Response(status=304, headers=headers)
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return web.Response(body=self.variants[encoding], content_type=self.content_type, headers=headers)
+
+
+class AssetManifest(object):
+    """
+    Fingerprints every file under static_dir and writes precompressed variants to
+    build_dir. Variants are named after the content hash, so builds are incremental.
+    """
+
+    def __init__(self, static_dir, build_dir):
+        self.static_dir = static_dir
+        self.build_dir = build_dir
+        self.assets = dict()  # 原始路径 -> Asset
+        self.by_name = dict()  # 带指纹的路径 -> Asset
+
+    def build(self):
+        start = time.perf_counter()
+        compressed = 0
+        for root, dirs, files in os.walk(self.static_dir):
+            for filename in files:
+                full = os.path.join(root, filename)
+                path = os.path.relpath(full, self.static_dir).replace(os.sep, '/')
+                asset, n = self._build_one(full, path)
+                compressed += n
+                self.assets[path] = asset
+                self.by_name[asset.name] = asset
+        logging.info('built %d static assets (%d new compressed files) in %.1fms' % (
+            len(self.assets), compressed, (time.perf_counter() - start) * 1000))
+        return self
+
+    def _build_one(self, full, path):
+        with open(full, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha1(data).hexdigest()[:12]
+        base, ext = os.path.splitext(path)
+        name = '%s.%s%s' % (base, digest, ext)
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        variants = dict(identity=data)
+        written = 0
+        if ext.lower() in COMPRESSIBLE:
+            compressors = [('gzip', '.gz', lambda d: gzip.compress(d, 9, mtime=0))]
+            if brotli is not None:
+                compressors.append(('br', '.br', lambda d: brotli.compress(d, quality=11)))
+            for encoding, suffix, compress in compressors:
+                target = os.path.join(self.build_dir, name + suffix)
+                if os.path.exists(target):
+                    with open(target, 'rb') as f:
+                        body = f.read()
+                else:
+                    body = compress(data)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    with open(target, 'wb') as f:
+                        f.write(body)
+                    written += 1
+                # 压缩后没有变小的不使用
+                if len(body) < len(data):
+                    variants[encoding] = body
+        return Asset(path, name, content_type, '"%s"' % digest, variants), written
+
+    def url(self, path):
+        asset = self.assets.get(path.lstrip('/'))
+        return '/static/' + (asset.name if asset is not None else path.lstrip('/'))
+
+    def handler(self):
+        async def static(request):
+            filename = request.match_info['filename']
+            asset = self.by_name.get(filename)
+            immutable = asset is not None
+            if asset is None:
+                # 未带指纹的旧地址仍然可用，但需要重新验证
+                asset = self.assets.get(filename)
+            if asset is None:
+                raise web.HTTPNotFound()
+            return asset.response(request, immutable)
+        return static
+
+
+_manifest = None
+
+def default_dirs():
+    here = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(here, 'static'), os.path.join(here, 'build', 'static')
+
+def init_assets(build_dir=None):
+    global _manifest
+    static_dir, default_build = default_dirs()
+    _manifest = AssetManifest(static_dir, build_dir or default_build).build()
+    return _manifest
+
+def static_url(path):
+    # 模板中使用：{{ static_url('js/vue.min.js') }}
+    if _manifest is None:
+        return '/static/' + path.lstrip('/')
+    return _manifest.url(path)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    init_assets()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Backfill the html_content column of blogs and comments.
+
+    python backfill_html.py [--alter] [--batch-size 500] [--all]
+
+--alter adds the html_content columns first (run once on databases created before
+the column existed). By default only rows with an empty html_content are rendered;
+--all re-renders every row, e.g. after changing markdown extensions.
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+import orm
+from config import configs
+from models import Blog, Comment
+from utils.utils import render_markdown
+
+
+async def add_column(model):
+    try:
+        await orm.execute("alter table `%s` add column `html_content` text not null" % model.__table__, ())
+        logging.warning(f"added html_content to {model.__table__}")
+    except Exception as e:
+        # 列已存在
+        logging.warning(f"skip alter {model.__table__}: {e}")
+
+async def backfill(model, batch_size, everything):
+    start = time.time()
+    where = None if everything else "`html_content`=''"
+    sql = "update `%s` set `html_content`=? where `%s`=?" % (model.__table__, model.__primary_key__)
+    total = 0
+    async for rows in model.iterate(where, batch_size=batch_size, batches=True):
+        await orm.execute_many(sql, [(render_markdown(r.content), r[model.__primary_key__]) for r in rows])
+        total += len(rows)
+        logging.warning(f"{model.__table__}: {total} rows rendered")
+    logging.warning(f"{model.__table__}: done, {total} rows in {time.time() - start:.1f}s")
+
+async def main(args):
+    await orm.create_pool(loop=asyncio.get_running_loop(), **configs.db)
+    try:
+        for model in (Blog, Comment):
+            if args.alter:
+                await add_column(model)
+            await backfill(model, args.batch_size, args.all)
+    finally:
+        await orm.close_pool()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='render markdown into html_content for existing rows')
+    parser.add_argument('--alter', action='store_true', help='add the html_content columns first')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--all', action='store_true', help='re-render rows that already have html_content')
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure the argument binding overhead of coroweb.RequestHandler for every route in handlers.py.
+
+Usage: python benchmarks/bench_dispatch.py [iterations]
+
+Each URL function is replaced by a no-op with the same signature, so the numbers
+are the cost of turning a request into keyword arguments. "legacy" is the generic
+RequestHandler.__call__ that parsed the query string, copied and filtered the dict
+and formatted the log line on every request.
+"""
+import asyncio
+import inspect
+import json
+import logging
+import os
+import sys
+import time
+import warnings
+
+from urllib import parse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+import coroweb
+import handlers
+from apis import APIError
+
+
+class LegacyRequestHandler(coroweb.RequestHandler):
+
+    async def __call__(self, request):
+        kw = None
+        if self._has_var_kw_arg or self._has_named_kw_args or self._required_kw_args:
+            if request.method == 'POST':
+                if not request.content_type:
+                    return web.HTTPBadRequest(text='Missing Content-Type.')
+                ct = request.content_type.lower()
+                if ct.startswith('application/json'):
+                    params = await request.json()
+                    if not isinstance(params, dict):
+                        return web.HTTPBadRequest(text='JSON body must be object.')
+                    kw = params
+                elif ct.startswith('application/x-www-form-urlencoded') or ct.startswith('multipart/form-data'):
+                    params = await request.post()
+                    kw = dict(**params)
+                else:
+                    return web.HTTPBadRequest(text='Unsupported Content-Type: %s' % request.content_type)
+            if request.method == 'GET':
+                qs = request.query_string
+                if qs:
+                    kw = dict()
+                    for k, v in parse.parse_qs(qs, True).items():
+                        kw[k] = v[0]
+        if kw is None:
+            kw = dict(**request.match_info)
+        else:
+            if not self._has_var_kw_arg and self._named_kw_args:
+                copy = dict()
+                for name in self._named_kw_args:
+                    if name in kw:
+                        copy[name] = kw[name]
+                kw = copy
+            for k, v in request.match_info.items():
+                if k in kw:
+                    logging.warning('Duplicate arg name in named arg and kw args: %s' % k)
+                kw[k] = v
+        if self._has_request_arg:
+            kw['request'] = request
+        if self._required_kw_args:
+            for name in self._required_kw_args:
+                if not name in kw:
+                    return web.HTTPBadRequest(text='Missing argument: %s' % name)
+        logging.info('call with args: %s' % str(kw))
+        try:
+            r = self._func(**kw)
+            if self._is_coroutine:
+                r = await r
+            return r
+        except APIError as e:
+            return dict(error=e.error, data=e.data, message=e.message)
+
+
+def noop(fn):
+    # 与URL函数签名相同的空函数
+    async def call(*args, **kw):
+        return None
+    call.__signature__ = inspect.signature(fn)
+    call.__name__ = fn.__name__
+    return call
+
+def routes():
+    for attr in dir(handlers):
+        fn = getattr(handlers, attr)
+        if attr.startswith('_') or not callable(fn) or not getattr(fn, '__route__', None):
+            continue
+        yield fn.__method__, fn.__route__, fn
+
+def sample_request(method, path, fn):
+    # 路由变量填'1'，其余命名关键字参数GET时放在查询字符串中，POST时放在JSON请求体中
+    match_info = {name: '1' for name in coroweb.get_route_args(path)}
+    url = path
+    for name in match_info:
+        url = url.replace('{%s}' % name, '1')
+    params = {name: '1' for name in coroweb.get_named_kw_args(fn) if name not in match_info}
+    if method == 'GET':
+        if params:
+            url += '?' + parse.urlencode(params)
+        return make_mocked_request(method, url, match_info=match_info)
+    request = make_mocked_request(method, url, headers={'Content-Type': 'application/json'}, match_info=match_info)
+    # 预先放入请求体，request.json()直接读取
+    request._read_bytes = json.dumps(params).encode('utf-8')
+    return request
+
+async def measure(handler, request, n):
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(n):
+            await handler(request)
+        elapsed = (time.perf_counter() - start) / n
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+async def main(n):
+    app = web.Application()
+    total_legacy = total = 0
+    print(f"{'route':<36} {'legacy':>10} {'binder':>10}")
+    for method, path, fn in sorted(routes(), key=lambda r: (r[1], r[0])):
+        stub = noop(fn)
+        request = sample_request(method, path, fn)
+        legacy = await measure(LegacyRequestHandler(app, stub, path), request, n)
+        binder = await measure(coroweb.RequestHandler(app, stub, path), request, n)
+        total_legacy += legacy
+        total += binder
+        print(f"{method + ' ' + path:<36} {legacy * 1e6:8.2f}us {binder * 1e6:8.2f}us")
+    print(f"{'total':<36} {total_legacy * 1e6:8.2f}us {total * 1e6:8.2f}us")
+
+if __name__ == '__main__':
+    warnings.simplefilter('ignore')
+    # 与app.py一样开启INFO日志，但不输出，只保留格式化的开销
+    logging.basicConfig(level=logging.INFO, handlers=[logging.NullHandler()])
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000))
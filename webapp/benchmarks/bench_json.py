@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare the JSON serialization used by response_factory before and after serializer.py.
+
+Usage: python benchmarks/bench_json.py [rows]
+
+legacy     json.dumps(..., default=lambda o: o.__dict__) as response_factory used to do
+json       serializer encoders on the standard library backend
+serializer serializer.dumps on the installed backend (orjson when available)
+chunked    serializer.iter_chunks, the incremental path for long lists
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import orm
+import serializer
+from apis import Page
+from models import Blog
+
+
+def legacy(r):
+    return json.dumps(r, ensure_ascii=False, default=lambda o: o.to_dict() if isinstance(o, orm.Row) else o.__dict__).encode('utf-8')
+
+_stdlib = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=serializer._default)
+
+def stdlib(r):
+    return _stdlib.encode(r).encode('utf-8')
+
+def chunked(r):
+    # 只统计分块本身，模拟边编码边写出
+    size = 0
+    for chunk in serializer.iter_chunks(r):
+        size += len(chunk)
+    return size
+
+def payloads(n):
+    # 与api_blogs相同的结构：Page加上一页Blog，分别用dict Model与compact=True的slotted行
+    now = time.time()
+    values = [dict(id=f"{i:050d}", user_id="u" * 50, user_name="管理员", user_image="http://img/%d" % i,
+                   name="日志 %d" % i, summary="摘要 " * 20, content="正文 " * 100, html_content="<p>正文</p>" * 100,
+                   created_at=now - i) for i in range(n)]
+    row = Blog.__row__
+    return [
+        ("page of 8 models", dict(page=Page(n, 1), blogs=[Blog(**v) for v in values[:8]])),
+        ("page of 8 rows", dict(page=Page(n, 1), blogs=[row(**v) for v in values[:8]])),
+        (f"{n} rows", dict(page=Page(n, 1, n), blogs=[row(**v) for v in values])),
+    ]
+
+def measure(label, fn, r):
+    # 时间取多次的最好值，峰值内存用tracemalloc统计单次编码
+    best = None
+    loops = 200 if len(r['blogs']) <= 8 else 5
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn(r)
+        elapsed = (time.perf_counter() - start) / loops
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    fn(r)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<11} {best * 1e6:10.1f} us/op   peak {peak / 1024:10.1f} KiB")
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    print(f"serializer backend: {serializer.backend}")
+    for label, r in payloads(n):
+        print(label)
+        measure("legacy", legacy, r)
+        measure("json", stdlib, r)
+        measure("serializer", serializer.dumps, r)
+        if serializer.should_stream(r):
+            measure("chunked", chunked, r)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Request latency under logging load: the RotatingFileHandler written on the event loop
+versus the logconfig queue pipeline, with and without production sampling.
+
+Usage: python benchmarks/bench_logging.py [requests] [concurrency]
+
+Every simulated request emits the lines a real request logs (middlewares,
+RequestHandler, two SQL statements) around short awaits standing in for I/O.
+Log files go to a temporary directory and rotate every 4MB.
+"""
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from logging.handlers import RotatingFileHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logconfig
+
+request_log = logging.getLogger('http.request')
+sql_log = logging.getLogger('orm.sql')
+MAX_BYTES = 4 * 1024 * 1024
+
+
+async def fake_request(i):
+    start = time.perf_counter()
+    kw = dict(page='1', cursor=None, id='%050d' % i)
+    request_log.info('Request: %s %s', 'GET', '/api/blogs')
+    request_log.info('check user: %s %s', 'GET', '/api/blogs')
+    request_log.info('Response handler...')
+    request_log.info('call with args: %s', kw)
+    for _ in range(2):
+        sql_log.info('SQL:%s', 'select `id`, `user_id`, `name`, `summary`, `created_at` from `blogs` order by created_at desc limit ?, ?')
+        await asyncio.sleep(0)
+        sql_log.info('row returned: %d', 8)
+    return time.perf_counter() - start
+
+async def run(n, concurrency):
+    latencies = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with sem:
+            latencies.append(await fake_request(i))
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return n / elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+def reset():
+    for logger in (logging.getLogger(), request_log, sql_log):
+        for h in list(logger.handlers):
+            logger.removeHandler(h)
+        for f in list(logger.filters):
+            logger.removeFilter(f)
+        logger.setLevel(logging.NOTSET)
+
+def direct(path):
+    # 原来的做法：根logger上直接挂RotatingFileHandler
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fh = RotatingFileHandler(path, maxBytes=MAX_BYTES, backupCount=3)
+    fh.setFormatter(logging.Formatter(logconfig.FORMAT))
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(fh)
+    return lambda: None
+
+def pipeline(path, **categories):
+    handler = logconfig.setup(file=path, max_bytes=MAX_BYTES, backup_count=3, categories=categories)
+    return lambda: print(f"    dropped: {handler.dropped or 0}")
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    cases = [
+        ('direct file', direct),
+        ('queue', pipeline),
+        ('queue+sampling', lambda path: pipeline(path, **{'http.request': {'sample': 0.1}, 'orm.sql': {'sample': 0.01}})),
+    ]
+    print(f"{n} requests, concurrency {concurrency}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, setup in cases:
+            reset()
+            report = setup(os.path.join(tmp, label.replace(' ', '_'), 'log'))
+            rps, p50, p99 = asyncio.run(run(n, concurrency))
+            logconfig.shutdown()
+            print(f"  {label:<16} {rps:9.0f} req/s   p50 {p50 * 1e3:7.2f}ms   p99 {p99 * 1e3:7.2f}ms")
+            report()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Microbenchmarks for the orm.py hot path, run against the in-process SQLite stand-in.
+
+Usage:
+    python benchmarks/bench_orm.py [--latency 0] [--out result.json] [--baseline old.json] [--tolerance 0.1]
+
+With --baseline the run is compared case by case and exits with status 1 when any
+case is slower than the baseline by more than the tolerance.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import orm
+from orm import Model, StringField, FloatField, TextField
+from models import User, Blog, Comment, next_id
+from standin import StandInPool, create_tables
+
+
+def define_model():
+    class BenchModel(Model):
+        __table__ = 'bench'
+
+        id = StringField(primary_key=True, default=next_id, ddl='varchar(50)')
+        name = StringField(ddl='varchar(50)')
+        content = TextField()
+        created_at = FloatField(default=time.time)
+    return BenchModel
+
+async def seed(n):
+    blogs = [Blog(user_id='u0', user_name='bench', user_image='about:blank', name=f'blog {i}',
+                  summary='summary ' * 10, content='content ' * 200, created_at=time.time() + i) for i in range(n)]
+    await Blog.save_many(blogs)
+    await User(email='bench@example.com', passwd='x' * 40, admin=False, name='bench', image='about:blank').save()
+    return blogs
+
+async def run_case(fn, seconds, async_case=True):
+    # 先预热，再在限定时间内尽量多地调用
+    for _ in range(10):
+        await fn() if async_case else fn()
+    ops = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while True:
+        for _ in range(50):
+            await fn() if async_case else fn()
+        ops += 50
+        if time.perf_counter() >= deadline:
+            break
+    elapsed = time.perf_counter() - start
+    # 分配统计单独跑一小段，避免tracemalloc拖慢计时
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(50):
+        await fn() if async_case else fn()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    allocations = sum(max(s.count_diff, 0) for s in stats)
+    return dict(ops=ops, seconds=elapsed, ops_per_sec=ops / elapsed, us_per_op=elapsed / ops * 1e6,
+                peak_bytes=peak, retained_blocks_per_op=allocations / 50)
+
+async def main(args):
+    pool = StandInPool(latency=args.latency, maxsize=10)
+    create_tables(pool, User, Blog, Comment)
+    orm.set_pools(pool)
+    blogs = await seed(args.rows)
+    blog = blogs[len(blogs) // 2]
+    counter = iter(range(10 ** 9))
+
+    async def find():
+        await Blog.find(blog.id)
+
+    async def find_all():
+        await Blog.findAll(orderby='created_at desc', limit=(0, 8))
+
+    async def find_all_compact():
+        await Blog.findAll(orderby='created_at desc', limit=(0, 8), compact=True)
+
+    async def find_number():
+        await Blog.findNumber('count(id)')
+
+    async def save():
+        await Comment(id=str(next(counter)), blog_id=blog.id, user_id='u0', user_name='bench',
+                      user_image='about:blank', content='comment').save()
+
+    async def update():
+        blog.summary = 'updated'
+        await blog.update()
+
+    async def select():
+        await orm.select('select `id`, `name` from `blogs` where `id`=?', [blog.id])
+
+    async def execute():
+        await orm.execute('update `blogs` set `summary`=? where `id`=?', ['raw', blog.id])
+
+    cases = [
+        ('metaclass', define_model, False),
+        ('find', find, True),
+        ('findAll', find_all, True),
+        ('findAll_compact', find_all_compact, True),
+        ('findNumber', find_number, True),
+        ('save', save, True),
+        ('update', update, True),
+        ('select', select, True),
+        ('execute', execute, True),
+    ]
+    results = dict()
+    for name, fn, async_case in cases:
+        if args.only and name not in args.only:
+            continue
+        r = await run_case(fn, args.seconds, async_case)
+        results[name] = r
+        print(f"{name:<16} {r['ops_per_sec']:>10.0f} ops/s {r['us_per_op']:>9.1f} us/op "
+              f"{r['peak_bytes']:>9.0f} B peak {r['retained_blocks_per_op']:>6.1f} blocks/op")
+    pool.close()
+    return dict(
+        python=platform.python_version(),
+        latency=args.latency,
+        rows=args.rows,
+        created_at=time.time(),
+        statement_cache=orm.statement_cache_stats(),
+        results=results,
+    )
+
+def compare(report, baseline, tolerance):
+    # 按us_per_op比较，慢于基线超过tolerance视为回归
+    regressions = []
+    for name, r in report['results'].items():
+        old = baseline.get('results', {}).get(name)
+        if old is None:
+            continue
+        change = r['us_per_op'] / old['us_per_op'] - 1
+        flag = ' REGRESSION' if change > tolerance else ''
+        print(f"{name:<16} {old['us_per_op']:>9.1f} -> {r['us_per_op']:>9.1f} us/op ({change:+.1%}){flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='orm.py microbenchmarks')
+    parser.add_argument('--latency', type=float, default=0.0, help='canned latency per statement, seconds')
+    parser.add_argument('--seconds', type=float, default=1.0, help='time budget per case')
+    parser.add_argument('--rows', type=int, default=1000, help='blogs to seed')
+    parser.add_argument('--only', nargs='*', help='run only these cases')
+    parser.add_argument('--out', help='write results as JSON')
+    parser.add_argument('--baseline', help='compare against a previous JSON result')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    parser.add_argument('--log', action='store_true', help='keep orm INFO logging on')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.log else logging.WARNING)
+    report = asyncio.run(main(args))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"results written to {args.out}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            sys.exit(1)
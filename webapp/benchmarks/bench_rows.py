@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare dict based Model rows with the slotted rows generated by ModelMetaclass.
+
+Usage: python benchmarks/bench_rows.py [rows]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Blog
+from orm import BooleanField, FloatField, IntegerField, TextField
+
+
+def fake_value(name, field, i):
+    # 按字段类型构造取值，模型增减字段时不必修改这里
+    if isinstance(field, BooleanField):
+        return False
+    if isinstance(field, IntegerField):
+        return i
+    if isinstance(field, FloatField):
+        return time.time()
+    if field.primary_key:
+        return f"{i:050d}"
+    if isinstance(field, TextField):
+        return f"{name} " * 100
+    return f"{name} {i}"
+
+def fake_rows(n):
+    # 模拟驱动返回的结果：DictCursor返回dict，普通Cursor返回tuple
+    columns = Blog.__row__.__columns__
+    tuples = [tuple(fake_value(c, Blog.__mappings__[c], i) for c in columns) for i in range(n)]
+    dicts = [dict(zip(columns, t)) for t in tuples]
+    return tuples, dicts
+
+def measure(label, build, n):
+    # 构造时间取多次的最好值，内存用tracemalloc统计构造出来的行
+    best = None
+    for _ in range(5):
+        start = time.perf_counter()
+        rows = build()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        del rows
+    tracemalloc.start()
+    rows = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # 读取每一行的字段，模拟模板渲染时的访问
+    start = time.perf_counter()
+    for r in rows:
+        r.id, r.name, r.summary, r.created_at
+    access = time.perf_counter() - start
+    print(f"{label:<12} build {best / n * 1e9:8.1f} ns/row   access {access / n * 1e9:8.1f} ns/row   memory {size / n:8.1f} B/row")
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    tuples, dicts = fake_rows(n)
+    row = Blog.__row__
+    print(f"Blog.findAll materialization, {n} rows")
+    measure("dict Model", lambda: [Blog(**r) for r in dicts], n)
+    measure("slotted Row", lambda: [row(*r) for r in tuples], n)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Checks read/write routing across a primary and two replicas, each a separate SQLite
+stand-in wired with orm.set_pools. Every pool holds a different version of the same
+row, so the value a read returns shows which pool served it.
+
+Usage: python benchmarks/check_routing.py
+
+Checks that selects go to the replicas (round_robin and least_busy), that writes go
+to the primary only, that a session reads from the primary for read_your_writes
+seconds after its own write, including through the batch loader, and that reads in
+a transaction stay on the primary. Exits with status 1 on the first failed check.
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import orm
+from models import Blog
+from standin import StandInPool, create_tables
+
+BLOG_ID = '0' * 50
+WINDOW = 0.3
+
+
+def check(label, actual, expected):
+    if actual != expected:
+        print(f"FAIL  {label}: got {actual!r}, expected {expected!r}")
+        sys.exit(1)
+    print(f"ok    {label}")
+
+async def name_in(pool):
+    # 绕过路由直接读某个连接池中的行
+    async with pool.acquire() as conn:
+        cur = await conn.cursor()
+        await cur.execute("select `name` from `blogs` where `id`=%s", (BLOG_ID,))
+        rs = await cur.fetchall()
+        await cur.close()
+    return rs[0][0] if rs else None
+
+async def find_name():
+    blog = await Blog.find(BLOG_ID)
+    return blog.name if blog else None
+
+async def in_session(key, coro_fn):
+    # 每个会话在自己的上下文中运行，bind_session不影响其他会话
+    async def run():
+        orm.bind_session(key)
+        return await coro_fn()
+    return await asyncio.ensure_future(run())
+
+async def main():
+    names = ('primary', 'replica0', 'replica1')
+    pools = [StandInPool() for _ in names]
+    for pool, name in zip(pools, names):
+        create_tables(pool, Blog)
+        orm.set_pools(pool)
+        await Blog(id=BLOG_ID, user_id='u', user_name='u', user_image='', name=name, summary='', content='',
+                   html_content='', created_at=time.time()).save()
+    primary, replicas = pools[0], pools[1:]
+    orm.set_pools(primary, replicas)
+    orm._read_your_writes = WINDOW
+    orm.disable_query_cache()
+    orm.disable_batch_loading()
+
+    # round_robin: 依次轮流使用两个从库，不读主库
+    orm._read_policy = 'round_robin'
+    served = [await find_name() for _ in range(4)]
+    check('round_robin reads alternate between the replicas', sorted(set(served)), ['replica0', 'replica1'])
+    check('round_robin never reads the primary', 'primary' in served, False)
+
+    # least_busy: replica0有连接在使用时读replica1
+    orm._read_policy = 'least_busy'
+    async with replicas[0].acquire():
+        check('least_busy avoids the busy replica', await find_name(), 'replica1')
+    async with replicas[1].acquire():
+        check('least_busy picks the other replica', await find_name(), 'replica0')
+
+    # 写入只发往主库
+    await Blog.update_where('`name`=?', '`id`=?', ['written', BLOG_ID])
+    check('write reaches the primary', await name_in(primary), 'written')
+    check('write does not reach replica0', await name_in(replicas[0]), 'replica0')
+    check('write does not reach replica1', await name_in(replicas[1]), 'replica1')
+
+    # 读写一致：写入的会话在窗口内读主库，其他会话仍读从库，窗口过后回到从库
+    async def write_then_read():
+        await Blog.update_where('`name`=?', '`id`=?', ['mine', BLOG_ID])
+        return await find_name()
+    check('writer reads its own write from the primary', await in_session('writer', write_then_read), 'mine')
+    check('writer keeps reading the primary in the window', await in_session('writer', find_name), 'mine')
+    check('other sessions read a replica', (await in_session('other', find_name)).startswith('replica'), True)
+    await asyncio.sleep(WINDOW + 0.05)
+    check('writer reads a replica after the window', (await in_session('writer', find_name)).startswith('replica'), True)
+
+    # 批量加载：同一批中处于窗口内的会话读主库，其他会话的合并查询读从库
+    orm.enable_batch_loading()
+    await in_session('writer', lambda: Blog.update_where('`name`=?', '`id`=?', ['batched', BLOG_ID]))
+    results = await asyncio.gather(in_session('other', find_name), in_session('writer', find_name),
+                                   in_session('third', find_name))
+    check('batched find of the writer reads the primary', results[1], 'batched')
+    check('batched find of other sessions reads a replica',
+          all(r.startswith('replica') for r in (results[0], results[2])), True)
+    orm.disable_batch_loading()
+
+    # 事务中的读写都在主库的同一个连接上
+    async with orm.transaction():
+        await Blog.update_where('`name`=?', '`id`=?', ['in tx', BLOG_ID])
+        check('reads in a transaction use the primary', await find_name(), 'in tx')
+    print('all routing checks passed')
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+End-to-end load test: boots the app with app.init_app in a server process backed by
+the seeded SQLite stand-in and drives a mix of scenarios over HTTP.
+
+Usage:
+    python benchmarks/loadtest.py [--duration 20] [--concurrency 50] [--latency 0.0005]
+                                  [--out result.json] [--baseline old.json] [--tolerance 0.1]
+                                  [--templates templates.txt]
+
+Scenarios (weight):
+    anon_index      GET /?page=1..5 without a session                        30
+    anon_blog       GET /blog/{id}, mostly the hot posts with many comments   30
+    user_api_blogs  GET /api/blogs?page=1..5 with a user session              20
+    post_comment    POST /api/blogs/{id}/comments on a hot post               10
+    admin_list      GET /api/comments and /api/users?page=1..5 as admin       10
+
+Reports RPS and p50/p95/p99 per scenario, and the event loop lag measured inside
+the server process. With --baseline the run exits with status 1 when a scenario's
+p99 or RPS is worse than the baseline by more than the tolerance. --templates
+writes the statement templates the server issued, for python schema.py verify.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import signal
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp
+
+SCENARIOS = (
+    ('anon_index', 30),
+    ('anon_blog', 30),
+    ('user_api_blogs', 20),
+    ('post_comment', 10),
+    ('admin_list', 10),
+)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def seed(args):
+    # 与线上数据的形状相近：大量用户与日志，少数热门日志下有数百条评论
+    from models import User, Blog, Comment
+    from utils.utils import COOKIE_NAME, user2cookie
+    now = time.time()
+    users = []
+    for i in range(args.users):
+        uid = '%015d%s000' % (int(now * 1000) - i, hashlib.md5(str(i).encode()).hexdigest())
+        users.append(User(id=uid, email='user%d@example.com' % i, passwd=hashlib.sha1(str(i).encode()).hexdigest(),
+                          admin=(i == 0), name='user %d' % i, image='about:blank', created_at=now - i))
+    await User.save_many(users)
+    blogs = [Blog(user_id=users[0].id, user_name=users[0].name, user_image='about:blank', name='blog %d' % i,
+                  summary='summary ' * 20, content='content ' * 300, html_content='<p>%s</p>' % ('content ' * 300),
+                  created_at=now - i) for i in range(args.blogs)]
+    await Blog.save_many(blogs)
+    hot = blogs[:args.hot]
+    comments = []
+    for blog in hot:
+        for j in range(args.comments):
+            user = users[j % len(users)]
+            comments.append(Comment(blog_id=blog.id, user_id=user.id, user_name=user.name, user_image='about:blank',
+                                    content='comment %d' % j, html_content='<p>comment %d</p>' % j, created_at=now - j))
+    await Comment.save_many(comments)
+    return dict(
+        blogs=[b.id for b in blogs[::max(1, len(blogs) // 500)]],
+        hot=[b.id for b in hot],
+        users=[user2cookie(u, 86400) for u in users[1:101]],
+        admin=user2cookie(users[0], 86400),
+        cookie_name=COOKIE_NAME,
+    )
+
+async def monitor_lag(samples, interval=0.01):
+    # 事件循环延迟：sleep(interval)实际多睡了多久
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(loop.time() - start - interval)
+
+async def serve(args, conn):
+    from aiohttp import web
+    import app
+    import orm
+    from benchmarks.standin import StandInPool, create_tables
+    from config import configs
+    from models import User, Blog, Comment
+
+    async def standin_pool(loop, **kw):
+        pool = StandInPool(latency=args.latency, minsize=kw.get('minsize', 1), maxsize=kw.get('maxsize', 10))
+        create_tables(pool, User, Blog, Comment)
+        return pool
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    loop.add_signal_handler(signal.SIGTERM, stop.set)
+    application = await app.init_app(loop, dict(configs.db, replicas=[]), pool_factory=standin_pool)
+    data = await seed(args)
+    runner = web.AppRunner(application, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    lag = []
+    task = asyncio.ensure_future(monitor_lag(lag))
+    conn.send(dict(data, port=port))
+    await stop.wait()
+    task.cancel()
+    lag.sort()
+    conn.send(dict(lag=dict(p50=percentile(lag, 0.5), p99=percentile(lag, 0.99), max=lag[-1] if lag else 0.0),
+                   templates=orm.statement_templates()))
+    await runner.cleanup()
+    await orm.close_pool()
+
+def run_server(args, conn):
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(serve(args, conn))
+
+
+class Client(object):
+    """
+    Closed-loop virtual users: each one picks a weighted scenario, waits for the
+    response and immediately starts the next request.
+    """
+
+    def __init__(self, base, data, session):
+        self.base = base
+        self.data = data
+        self.session = session
+        self.names = [n for n, _ in SCENARIOS]
+        self.weights = [w for _, w in SCENARIOS]
+
+    def request(self, name):
+        data = self.data
+        page = random.randint(1, 5)
+        if name == 'anon_index':
+            return 'GET', '/?page=%d' % page, None, None
+        if name == 'anon_blog':
+            blog = random.choice(data['hot'] if random.random() < 0.8 else data['blogs'])
+            return 'GET', '/blog/%s' % blog, None, None
+        if name == 'user_api_blogs':
+            return 'GET', '/api/blogs?page=%d' % page, random.choice(data['users']), None
+        if name == 'post_comment':
+            body = dict(content='load test comment %d' % random.randint(0, 1 << 30))
+            return 'POST', '/api/blogs/%s/comments' % random.choice(data['hot']), random.choice(data['users']), body
+        path = random.choice(('/api/comments', '/api/users'))
+        return 'GET', '%s?page=%d' % (path, page), data['admin'], None
+
+    async def user(self, results, deadline, record_after):
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                return
+            name = random.choices(self.names, self.weights)[0]
+            method, path, cookie, body = self.request(name)
+            cookies = {self.data['cookie_name']: cookie} if cookie else None
+            start = time.perf_counter()
+            try:
+                async with self.session.request(method, self.base + path, json=body, cookies=cookies) as resp:
+                    await resp.read()
+                    ok = resp.status < 400
+            except aiohttp.ClientError:
+                ok = False
+            elapsed = time.perf_counter() - start
+            if start >= record_after:
+                r = results.setdefault(name, dict(latencies=[], errors=0))
+                r['latencies'].append(elapsed)
+                if not ok:
+                    r['errors'] += 1
+
+async def drive(args, data):
+    base = 'http://127.0.0.1:%d' % data['port']
+    results = dict()
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    # 每个请求单独携带cookie，不共享cookie jar
+    async with aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.DummyCookieJar()) as session:
+        client = Client(base, data, session)
+        start = time.perf_counter()
+        record_after = start + args.warmup
+        deadline = record_after + args.duration
+        await asyncio.gather(*(client.user(results, deadline, record_after) for _ in range(args.concurrency)))
+    report = dict()
+    for name, _ in SCENARIOS:
+        r = results.get(name)
+        if not r:
+            continue
+        latencies = sorted(r['latencies'])
+        report[name] = dict(requests=len(latencies), errors=r['errors'], rps=len(latencies) / args.duration,
+                            p50=percentile(latencies, 0.5), p95=percentile(latencies, 0.95),
+                            p99=percentile(latencies, 0.99))
+    return report
+
+def print_report(report):
+    print(f"{'scenario':<16} {'requests':>9} {'errors':>7} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name, r in report['results'].items():
+        print(f"{name:<16} {r['requests']:>9} {r['errors']:>7} {r['rps']:>9.1f} {r['p50'] * 1e3:>7.2f}ms "
+              f"{r['p95'] * 1e3:>7.2f}ms {r['p99'] * 1e3:>7.2f}ms")
+    print(f"{'total':<16} {report['requests']:>9} {report['errors']:>7} {report['rps']:>9.1f}")
+    lag = report['loop_lag']
+    print(f"event loop lag: p50 {lag['p50'] * 1e3:.2f}ms  p99 {lag['p99'] * 1e3:.2f}ms  max {lag['max'] * 1e3:.2f}ms")
+
+def compare(report, baseline, tolerance):
+    # p99变慢或RPS下降超过tolerance视为回归
+    regressions = []
+    for name, r in report['results'].items():
+        old = baseline.get('results', {}).get(name)
+        if old is None:
+            continue
+        p99 = r['p99'] / old['p99'] - 1 if old['p99'] else 0.0
+        rps = r['rps'] / old['rps'] - 1 if old['rps'] else 0.0
+        flag = ' REGRESSION' if p99 > tolerance or rps < -tolerance else ''
+        print(f"{name:<16} p99 {old['p99'] * 1e3:7.2f} -> {r['p99'] * 1e3:7.2f}ms ({p99:+.1%})  "
+              f"rps {old['rps']:8.1f} -> {r['rps']:8.1f} ({rps:+.1%}){flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def main(args):
+    parent, child = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=run_server, args=(args, child))
+    server.start()
+    # 关闭父进程中的子进程端，服务进程异常退出时recv抛出EOFError而不是一直阻塞
+    child.close()
+    data = parent.recv()
+    print(f"seeded {args.users} users, {args.blogs} blogs, {args.hot} hot posts x {args.comments} comments; "
+          f"serving on port {data['port']}")
+    try:
+        results = asyncio.run(drive(args, data))
+    finally:
+        os.kill(server.pid, signal.SIGTERM)
+    stats = parent.recv()
+    server.join()
+    if args.templates:
+        with open(args.templates, 'w') as f:
+            f.write('\n'.join(stats['templates']) + '\n')
+        print(f"{len(stats['templates'])} statement templates written to {args.templates}")
+    requests = sum(r['requests'] for r in results.values())
+    return dict(
+        python=platform.python_version(),
+        created_at=time.time(),
+        options=dict(duration=args.duration, concurrency=args.concurrency, latency=args.latency, users=args.users,
+                     blogs=args.blogs, hot=args.hot, comments=args.comments),
+        requests=requests,
+        errors=sum(r['errors'] for r in results.values()),
+        rps=requests / args.duration,
+        loop_lag=stats['lag'],
+        results=results,
+    )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='end-to-end load test')
+    parser.add_argument('--duration', type=float, default=20.0, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=3.0, help='seconds before measuring')
+    parser.add_argument('--concurrency', type=int, default=50, help='virtual users')
+    parser.add_argument('--latency', type=float, default=0.0005, help='canned latency per statement, seconds')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--blogs', type=int, default=5000)
+    parser.add_argument('--hot', type=int, default=10, help='posts that get most of the traffic')
+    parser.add_argument('--comments', type=int, default=300, help='comments per hot post')
+    parser.add_argument('--out', help='write results as JSON')
+    parser.add_argument('--baseline', help='compare against a previous JSON result')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    parser.add_argument('--templates', help='write the statement templates the server issued')
+    args = parser.parse_args()
+    report = main(args)
+    print_report(report)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"results written to {args.out}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+In-process database stand-in that speaks the subset of the aiomysql pool interface
+used by orm.py, backed by SQLite.
+
+    pool = StandInPool(latency=0.0005)
+    create_tables(pool, User, Blog, Comment)
+    orm.set_pools(pool)
+"""
+import asyncio
+import sqlite3
+
+from collections import deque
+
+
+def _concat(*args):
+    return "".join("" if a is None else str(a) for a in args)
+
+
+class StandInCursor(object):
+
+    def __init__(self, conn, as_dict):
+        self._conn = conn
+        self._as_dict = as_dict
+        self._cur = conn._db.cursor()
+        self.rowcount = -1
+
+    async def execute(self, sql, args=()):
+        await self._conn._delay()
+        # aiomysql使用"%s"占位符，SQLite使用"?"
+        self._cur.execute(sql.replace("%s", "?"), tuple(args or ()))
+        self.rowcount = self._cur.rowcount
+        return self.rowcount
+
+    async def executemany(self, sql, args_list):
+        await self._conn._delay()
+        self._cur.executemany(sql.replace("%s", "?"), [tuple(a) for a in args_list])
+        self.rowcount = self._cur.rowcount
+        return self.rowcount
+
+    def _convert(self, rows):
+        if not self._as_dict:
+            return rows
+        names = [d[0] for d in self._cur.description]
+        return [dict(zip(names, r)) for r in rows]
+
+    async def fetchone(self):
+        r = self._cur.fetchone()
+        return None if r is None else self._convert([r])[0]
+
+    async def fetchmany(self, size=None):
+        return self._convert(self._cur.fetchmany(size or self._cur.arraysize))
+
+    async def fetchall(self):
+        return self._convert(self._cur.fetchall())
+
+    async def close(self):
+        self._cur.close()
+
+
+class StandInConnection(object):
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._db = pool._db
+        self.closed = False
+
+    async def _delay(self):
+        if self._pool.latency:
+            await asyncio.sleep(self._pool.latency)
+        else:
+            await asyncio.sleep(0)
+
+    async def cursor(self, cursor=None):
+        # DictCursor/SSDictCursor返回dict，其余返回tuple
+        return StandInCursor(self, cursor is not None and "Dict" in cursor.__name__)
+
+    async def begin(self):
+        self._db.execute("begin")
+
+    async def commit(self):
+        if self._db.in_transaction:
+            self._db.execute("commit")
+
+    async def rollback(self):
+        if self._db.in_transaction:
+            self._db.execute("rollback")
+
+    async def ping(self, reconnect=True):
+        await self._delay()
+
+    def close(self):
+        self.closed = True
+
+
+class _Acquire(object):
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._conn = None
+
+    def __await__(self):
+        return self._pool._acquire().__await__()
+
+    async def __aenter__(self):
+        self._conn = await self._pool._acquire()
+        return self._conn
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._pool.release(self._conn)
+        self._conn = None
+
+
+class StandInPool(object):
+    """
+    A pool of StandInConnection sharing one SQLite database; latency is added to every statement.
+    """
+
+    def __init__(self, database=":memory:", latency=0.0, minsize=1, maxsize=10):
+        self.latency = latency
+        self.minsize = minsize
+        # 所有连接共享同一个SQLite连接，这样":memory:"库在连接之间可见；事务由调用者显式begin
+        self._db = sqlite3.connect(database, isolation_level=None, check_same_thread=False)
+        self._db.create_function("concat", -1, _concat)
+        # 与aiomysql一样，maxsize就是空闲队列的maxlen
+        self._free = deque(maxlen=maxsize)
+        self._used = set()
+        self._cond = asyncio.Condition()
+
+    @property
+    def maxsize(self):
+        return self._free.maxlen
+
+    @property
+    def size(self):
+        return len(self._free) + len(self._used)
+
+    @property
+    def freesize(self):
+        return len(self._free)
+
+    def acquire(self):
+        return _Acquire(self)
+
+    async def _acquire(self):
+        async with self._cond:
+            while not self._free and self.size >= self.maxsize:
+                await self._cond.wait()
+            conn = self._free.popleft() if self._free else StandInConnection(self)
+            self._used.add(conn)
+            return conn
+
+    def release(self, conn):
+        self._used.discard(conn)
+        if not conn.closed:
+            self._free.append(conn)
+        asyncio.ensure_future(self._notify())
+
+    async def _notify(self):
+        async with self._cond:
+            self._cond.notify()
+
+    def close(self):
+        self._db.close()
+
+    async def wait_closed(self):
+        pass
+
+
+def create_tables(pool, *models):
+    # 按模型的字段与索引定义建表
+    for model in models:
+        columns = []
+        for name, field in model.__mappings__.items():
+            column = "`%s` %s" % (name, field.column_type)
+            if field.primary_key:
+                column += " primary key"
+            columns.append(column)
+        pool._db.execute("create table if not exists `%s` (%s)" % (model.__table__, ", ".join(columns)))
+        for index in model.__indexes__:
+            pool._db.execute("create %sindex if not exists `%s` on `%s` (%s)" % (
+                "unique " if index["unique"] else "", index["name"], model.__table__,
+                ", ".join("`%s`" % c for c in index["columns"])))
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Dynamic compression of rendered pages and API responses.
+"""
+import asyncio
+import gzip
+import logging
+import time
+
+from aiohttp import web
+
+import metrics
+from assets import accepted_encodings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml', 'image/svg+xml')
+RATIO_BUCKETS = (.1, .2, .3, .4, .5, .6, .7, .8, .9, 1.0)
+
+
+class Compressor(object):
+    """
+    Compresses response bodies larger than min_size with the best encoding the client
+    accepts. Bodies larger than executor_size are compressed in the default executor.
+    """
+
+    def __init__(self, min_size=1024, level=6, brotli_quality=4, executor_size=64 * 1024):
+        self.min_size = min_size
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.executor_size = executor_size
+
+    def negotiate(self, accept_encoding):
+        encodings = accepted_encodings(accept_encoding)
+        if brotli is not None and 'br' in encodings:
+            return 'br'
+        if 'gzip' in encodings or '*' in encodings:
+            return 'gzip'
+        return None
+
+    def _compress(self, body, encoding):
+        # 在哪个线程执行就统计哪个线程的CPU时间
+        start = time.thread_time()
+        if encoding == 'br':
+            data = brotli.compress(body, quality=self.brotli_quality)
+        else:
+            data = gzip.compress(body, self.level, mtime=0)
+        return data, time.thread_time() - start
+
+    async def compress(self, body, encoding):
+        if len(body) >= self.executor_size:
+            return await asyncio.get_running_loop().run_in_executor(None, self._compress, body, encoding)
+        return self._compress(body, encoding)
+
+    async def apply(self, request, resp, route):
+        # 已经压缩、流式输出或不适合压缩的响应原样返回
+        if type(resp) is not web.Response or not isinstance(resp.body, bytes):
+            return resp
+        if not (resp.content_type or '').startswith(COMPRESSIBLE_TYPES):
+            return resp
+        resp.headers['Vary'] = 'Accept-Encoding'
+        if resp.status != 200 or 'Content-Encoding' in resp.headers or len(resp.body) < self.min_size:
+            return resp
+        encoding = self.negotiate(request.headers.get('Accept-Encoding'))
+        if encoding is None:
+            return resp
+        body = resp.body
+        data, cpu = await self.compress(body, encoding)
+        _m_cpu.inc(route, encoding, amount=cpu)
+        _m_ratio.observe(len(data) / len(body), route, encoding)
+        _m_bytes.inc(route, 'in', amount=len(body))
+        _m_bytes.inc(route, 'out', amount=len(data))
+        if len(data) >= len(body):
+            return resp
+        resp.body = data
+        resp.headers['Content-Encoding'] = encoding
+        return resp
+
+
+# 全局的压缩器，app.init按configs.compression配置；None表示关闭
+compressor = Compressor()
+
+def configure(**kw):
+    global compressor
+    compressor = Compressor(**kw) if kw else None
+    logging.info(f"compression: {kw or 'off'}, brotli={'on' if brotli is not None else 'off'}")
+    return compressor
+
+_m_ratio = metrics.Histogram('http_compression_ratio', 'Compressed size divided by original size per route.',
+                             ('route', 'encoding'), buckets=RATIO_BUCKETS)
+_m_cpu = metrics.Counter('http_compression_cpu_seconds_total', 'CPU time spent compressing responses per route.',
+                         ('route', 'encoding'))
+_m_bytes = metrics.Counter('http_compression_bytes_total', 'Response bytes before and after compression per route.',
+                           ('route', 'direction'))
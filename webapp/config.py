@@ -1,5 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import os
+
 import config_default
 
 
@@ -25,7 +27,8 @@ def merge(defaults, override):
     r = {}
     for k, v in defaults.items():
         if k in override:
-            if isinstance(v, dict):
+            # 覆盖为None等非dict的值时整体替换，用来关闭query_cache、compression等功能
+            if isinstance(v, dict) and isinstance(override[k], dict):
                 r[k] = merge(v, override[k])
             else:
                 r[k] = override[k]
@@ -41,6 +44,11 @@ def toDict(d):
 
 configs = config_default.configs
 
+# 生产环境的配置需要显式打开：WEBAPP_ENV=production python server.py
+if os.environ.get('WEBAPP_ENV') == 'production':
+    import config_production
+    configs = merge(configs, config_production.configs)
+
 try:
     import config_override
     configs = merge(configs, config_override.configs)
@@ -2,14 +2,111 @@
 # -*- coding: utf-8 -*-
 configs = {
     'debug': True,
+    # 服务进程：python server.py启动workers个工作进程(0表示CPU核数)，共享SO_REUSEPORT端口，
+    # 每个进程有自己的连接池，pool_maxsize限制每个进程的连接数(含自适应扩容的上限)，
+    # 总连接数约为workers * pool_maxsize；shutdown_timeout为退出时等待处理中请求的秒数。
+    # 页面、查询与会话缓存在每个进程中各有一份，写入引起的失效由主进程转发给其他工作进程
+    'server': {
+        'host': '127.0.0.1',
+        'port': 9000,
+        'workers': 1,
+        'pool_maxsize': None,
+        'shutdown_timeout': 30,
+        'restart_delay': 1
+    },
     'db': {
         'host': '127.0.0.1',
         'port': 3306,
         'user': 'root',
         'password': 'password',
-        'db': 'webapp'
+        'db': 'webapp',
+        # 从库列表，每一项只写与主库不同的配置，如{'host': '10.0.0.2'}
+        'replicas': [],
+        # 从库选择策略：round_robin或least_busy
+        'read_policy': 'round_robin',
+        # 会话写入后多少秒内读请求仍然走主库
+        'read_your_writes': 5,
+        'minsize': 1,
+        'maxsize': 10,
+        # 连接池维护：启动预热、空闲连接健康检查(秒)、连接回收(秒，-1不回收)，
+        # adaptive为自适应大小的上下界，按取连接的平均等待时间扩容，空闲时收缩
+        'pool': {
+            'warmup': True,
+            'health_interval': 30,
+            'recycle': 3600,
+            'adaptive': {
+                'min': 5,
+                'max': 30,
+                'grow_wait': 0.01,
+                'step': 2,
+                'interval': 10,
+                'idle_ticks': 6
+            }
+        },
+        # 超过该秒数的语句记入慢查询日志，设为None关闭
+        'slow_query': 1.0,
+        # 查询结果缓存，设为None关闭；表上的任何写入都会使该表的缓存失效
+        'query_cache': {
+            'maxsize': 1024,
+            'max_bytes': 16 * 1024 * 1024,
+            'ttl': 60
+        },
+        # 合并同一轮事件循环中的Model.find，window为额外的收集窗口(秒)，设为None关闭
+        'batch_loader': {
+            'window': 0,
+            'max_batch': 100
+        }
+    },
+    # 模板：production为True时启动时预编译全部模板并关闭自动重载，
+    # bytecode_cache为字节码缓存目录(None时使用系统临时目录)
+    'templates': {
+        'production': False,
+        'bytecode_cache': None
+    },
+    # 静态文件：fingerprint为True时启动时给文件名加内容哈希并预压缩(gzip，安装了brotli时也生成br)，
+    # 以Cache-Control: immutable提供；build_dir为预压缩文件目录(None时为webapp/build/static)
+    'static': {
+        'fingerprint': False,
+        'build_dir': None
+    },
+    # 动态响应压缩：超过min_size字节的HTML/JSON按Accept-Encoding压缩(安装了brotli时优先br)，
+    # 超过executor_size字节的在线程池中压缩；设为None关闭
+    'compression': {
+        'min_size': 1024,
+        'level': 6,
+        'brotli_quality': 4,
+        'executor_size': 64 * 1024
+    },
+    # /metrics只对管理员开放；设置token后，带Authorization: Bearer <token>请求头的抓取方(如Prometheus)也可以访问
+    'metrics': {
+        'token': None
+    },
+    # 匿名页面的输出缓存：字节上限与过期秒数
+    'page_cache': {
+        'max_bytes': 32 * 1024 * 1024,
+        'ttl': 300
+    },
+    # 日志：由后台线程写入轮转文件(file为None时为../logs/log)，queue_size为待写记录的上限，
+    # 队列接近满时丢弃WARNING以下的记录；categories按类别设置级别与采样率(0~1，只对WARNING以下生效)
+    'logging': {
+        'file': None,
+        'max_bytes': 100 * 1024 * 1024,
+        'backup_count': 10,
+        'level': 'INFO',
+        'queue_size': 10000,
+        'categories': {
+            'http.request': {'level': 'INFO', 'sample': 1.0},
+            'orm.sql': {'level': 'INFO', 'sample': 1.0}
+        }
     },
     'session': {
-        'secret': 'goblintech'
+        'secret': 'goblintech',
+        # 已验证cookie的缓存：条目上限、有效秒数(不超过cookie本身的过期时间)与无效cookie的缓存秒数；
+        # 设为None关闭。多进程部署时各进程独立缓存，users表的写入经server.py转发到所有工作进程
+        'cache': {
+            'maxsize': 10000,
+            'ttl': 60,
+            'negative_ttl': 30
+        }
     }
 }
\ No newline at end of file
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Production configurations.
+只在环境变量WEBAPP_ENV=production时加载，在config_default.py之上、config_override.py之下合并，
+本地开发时模板自动重载、静态文件不加指纹、日志不采样
+"""
+
+
+configs = {
+    'server': {
+        'workers': 0,
+        'pool_maxsize': 8
+    },
+    'templates': {
+        'production': True
+    },
+    'static': {
+        'fingerprint': True
+    },
+    'logging': {
+        'categories': {
+            'http.request': {'sample': 0.1},
+            'orm.sql': {'sample': 0.01}
+        }
+    }
+}
@@ -2,15 +2,17 @@
 # -*- coding: utf-8 -*-
 import asyncio
 import os
+import re
 import inspect
 import logging
 import functools
 
-from urllib import parse
 from aiohttp import web
 
 from apis import APIError
 
+request_log = logging.getLogger('http.request')
+
 """
 def handler_decorator(path,*,method):
     def decorator(func):
@@ -103,9 +105,20 @@ def has_request_arg(fn):
     return found
 
 
-class RequestHandler(object):
+def get_route_args(path):
+    # 路由中的变量，如'/blog/{id}'中的id，'{name:regex}'形式同样支持
+    return tuple(m.group(1) for m in re.finditer(r'\{([A-Za-z_][A-Za-z0-9_]*)(?::[^{}]*(?:\{[^{}]*\}[^{}]*)*)?\}', path or ''))
+
 
-    def __init__(self, app, fn):
+class RequestHandler(object):
+    """
+    Binds request data to the URL function's arguments. The binder is generated once
+    per function from its signature and route, so a request only does the work the
+    function needs: no body parsing when every argument comes from the route, and
+    only the named arguments are read from the query string or body.
+    """
+
+    def __init__(self, app, fn, path=None):
         self._app = app
         self._func = fn
         self._has_request_arg = has_request_arg(fn)
@@ -113,67 +126,96 @@ class RequestHandler(object):
         self._has_named_kw_args = has_named_kw_args(fn)
         self._named_kw_args = get_named_kw_args(fn)
         self._required_kw_args = get_required_kw_args(fn)
+        self._route_args = get_route_args(path)
+        # get/post装饰后的函数不是协程函数，按被装饰的原函数判断
+        self._is_coroutine = asyncio.iscoroutinefunction(inspect.unwrap(fn))
+        self._bind = self._make_binder()
+
+    def _make_binder(self):
+        has_request_arg = self._has_request_arg
+        if not (self._has_var_kw_arg or self._has_named_kw_args):
+            # 只接收路由变量
+            async def bind_route(request):
+                kw = dict(request.match_info)
+                if has_request_arg:
+                    kw['request'] = request
+                return kw
+            return bind_route
+        # 路由变量总是存在且会覆盖同名参数，所以只需从查询字符串或请求体中读取其余的命名关键字参数
+        names = None if self._has_var_kw_arg else tuple(n for n in self._named_kw_args if n not in self._route_args)
+        required = tuple(n for n in self._required_kw_args if n not in self._route_args)
+        read_body = names is None or bool(names)
+
+        async def bind(request):
+            params = None
+            if request.method == 'POST':
+                if read_body:
+                    params = await read_post_params(request)
+                    if isinstance(params, web.StreamResponse):
+                        return params
+            elif request.method == 'GET':
+                params = request.query
+            if not params:
+                kw = dict()
+            elif names is None:
+                kw = {k: params[k] for k in params.keys()}
+            else:
+                kw = {name: params[name] for name in names if name in params}
+            if names is None and request.match_info:
+                for k in request.match_info:
+                    if k in kw:
+                        logging.warning('Duplicate arg name in named arg and kw args: %s', k)
+            kw.update(request.match_info)
+            if has_request_arg:
+                kw['request'] = request
+            for name in required:
+                if name not in kw:
+                    return web.HTTPBadRequest(text='Missing argument: %s' % name)
+            return kw
+        return bind
 
     # RequestHandler本身是一个类，由于定义了__call__方法，因此将其实例视为函数
     # 该函数从request中获取必要参数，之后调用URL函数
     # 最后将结果转换为web.Response对象
     async def __call__(self, request):
-        kw = None
-        if self._has_var_kw_arg or self._has_named_kw_args or self._required_kw_args:
-            if request.method == 'POST':
-                if not request.content_type:
-                    return web.HTTPBadRequest(text='Missing Content-Type.')
-                ct = request.content_type.lower()
-                if ct.startswith('application/json'):
-                    params = await request.json()
-                    if not isinstance(params, dict):
-                        return web.HTTPBadRequest(text='JSON body must be object.')
-                    kw = params
-                elif ct.startswith('application/x-www-form-urlencoded') or ct.startswith('multipart/form-data'):
-                    params = await request.post()
-                    kw = dict(**params)
-                else:
-                    return web.HTTPBadRequest(text='Unsupported Content-Type: %s' % request.content_type)
-            if request.method == 'GET':
-                qs = request.query_string
-                if qs:
-                    kw = dict()
-                    for k, v in parse.parse_qs(qs, True).items():
-                        kw[k] = v[0]
-        if kw is None:
-            kw = dict(**request.match_info)
-        else:
-            if not self._has_var_kw_arg and self._named_kw_args:
-                # 当函数参数没有关键字参数时，移去request除命名关键字参数外所有的参数信息
-                copy = dict()
-                for name in self._named_kw_args:
-                    if name in kw:
-                        copy[name] = kw[name]
-                kw = copy
-            # check named arg: 即加入命名关键字参数(没有附加默认值),request没有提供相应的数值，报错
-            for k, v in request.match_info.items():
-                if k in kw:
-                    logging.warning('Duplicate arg name in named arg and kw args: %s' % k)
-                kw[k] = v
-        if self._has_request_arg:
-            kw['request'] = request
-        # check required kw:
-        if self._required_kw_args:
-            for name in self._required_kw_args:
-                if not name in kw:
-                    return web.HTTPBadRequest(text='Missing argument: %s' % name)
-        logging.info('call with args: %s' % str(kw))
+        kw = await self._bind(request)
+        if not isinstance(kw, dict):
+            return kw
+        # 惰性格式化，日志级别关闭时不生成参数字符串
+        request_log.info('call with args: %s', kw)
         try:
-            r = await self._func(**kw)
+            r = self._func(**kw)
+            if self._is_coroutine:
+                r = await r
             return r
         except APIError as e:
             return dict(error=e.error, data=e.data, message=e.message)
 
 
-def add_static(app):
+async def read_post_params(request):
+    # 按Content-Type解析POST请求体，出错时返回HTTPBadRequest
+    if not request.content_type:
+        return web.HTTPBadRequest(text='Missing Content-Type.')
+    ct = request.content_type.lower()
+    if ct.startswith('application/json'):
+        params = await request.json()
+        if not isinstance(params, dict):
+            return web.HTTPBadRequest(text='JSON body must be object.')
+        return params
+    if ct.startswith('application/x-www-form-urlencoded') or ct.startswith('multipart/form-data'):
+        return await request.post()
+    return web.HTTPBadRequest(text='Unsupported Content-Type: %s' % request.content_type)
+
+
+def add_static(app, manifest=None):
     path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
-    app.router.add_static('/static/', path)
-    logging.info('add static %s => %s' % ('/static/', path))
+    if manifest is None:
+        app.router.add_static('/static/', path)
+        logging.info('add static %s => %s' % ('/static/', path))
+        return
+    # 由assets.AssetManifest在内存中提供带指纹、预压缩的文件
+    app.router.add_get('/static/{filename:.+}', manifest.handler())
+    logging.info('add fingerprinted static %s => %s (%d files)' % ('/static/', path, len(manifest.assets)))
 
 def add_route(app, fn):
     # 用来注册一个URL处理函数，验证函数是否包含URL的相应方法与路径信息，并将其函数变为协程
@@ -181,10 +223,8 @@ def add_route(app, fn):
     path = getattr(fn, '__route__', None)
     if path is None or method is None:
         raise ValueError('@get or @post not defined in %s.' % str(fn))
-    if not asyncio.iscoroutinefunction(fn) and not inspect.isgeneratorfunction(fn):
-        fn = asyncio.coroutine(fn)
     logging.info('add route %s %s => %s(%s)' % (method, path, fn.__name__, ', '.join(inspect.signature(fn).parameters.keys())))
-    app.router.add_route(method, path, RequestHandler(app, fn))
+    app.router.add_route(method, path, RequestHandler(app, fn, path))
 
 
 # 自动将module_name模块中所有符合条件的函数进行注册
@@ -1,26 +1,42 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import json
-import markdown
 from aiohttp import web
 from aiohttp.web_response import Response
 
+import metrics
+import pagecache
+import serializer
+from orm import transaction
 from coroweb import get, post
-from apis import Page, APIValueError, APIResourceNotFoundError
+from apis import Page, CursorPage, APIValueError, APIResourceNotFoundError
 from models import Comment, Blog, next_id
 from utils.utils import *
 
 
-# 处理首页url
+# 键集分页：按(created_at, id)倒序从游标处继续读取(before时反向读取上一页)，不扫描被跳过的行，也不需要count(id)；
+# 列表不读取html_content等deferred列
+async def find_by_cursor(model, cursor, compact=False, before=None):
+    p = CursorPage(cursor, before=before)
+    items = await model.findAll(seek=p.seek, after=p.start, desc=p.desc, limit=p.limit, compact=compact, defer=True)
+    return p, p.trim(items)
+
+# 处理首页url；默认按游标分页，带page参数的旧链接仍按页码分页
 @get("/")
-async def index(*, page="1"):
+async def index(*, page=None, cursor=None, before=None):
+    if page is None:
+        p, blogs = await find_by_cursor(Blog, cursor, compact=True, before=before)
+        return {
+            "__template__": "blogs.html",
+            "page": p,
+            "blogs": blogs
+        }
     page_index = get_page_index(page)
-    num = await Blog.findNumber("count(id)")
+    num = await Blog.findNumber("count(id)", cache=True)
     p = Page(num, page_index)
     if num == 0:
         blogs = []
     else:
-        blogs = await Blog.findAll(orderby="created_at desc", limit=(p.offset, p.limit))
+        blogs = await Blog.findAll(orderby="created_at desc", limit=(p.offset, p.limit), compact=True, cache=True, defer=True)
     return {
         "__template__": "blogs.html",
         "page": p,
@@ -32,9 +48,12 @@ async def index(*, page="1"):
 async def get_blog(id):
     blog = await Blog.find(id)
     comments = await Comment.findAll("blog_id=?", [id], orderby="created_at desc")
+    # 新数据在写入时已渲染好；尚未回填的旧数据在这里渲染(按内容缓存)
     for comment in comments:
-        comment.html_content = markdown.markdown(comment.content)
-    blog.html_content = markdown.markdown(blog.content)
+        if not comment.html_content:
+            comment.html_content = render_markdown(comment.content)
+    if not blog.html_content:
+        blog.html_content = render_markdown(blog.content)
     return {
         "__template__": "blog.html",
         "blog": blog,
@@ -76,7 +95,7 @@ async def authenticate(*, email, passwd):
     r.set_cookie(COOKIE_NAME, user2cookie(user, 86400), max_age=86400, httponly=True)
     user.passwd = "******"
     r.content_type = "application/json"
-    r.body = json.dumps(user, ensure_ascii=False).encode("utf-8")
+    r.body = serializer.dumps(user)
     return r
 
 # 用户注销
@@ -137,13 +156,16 @@ def manage_users(*, page="1"):
 
 # 获取评论信息API
 @get("/api/comments")
-async def api_comments(*, page="1"):
+async def api_comments(*, page="1", cursor=None):
+    if cursor is not None:
+        p, comments = await find_by_cursor(Comment, cursor)
+        return dict(page=p, comments=comments)
     page_index = get_page_index(page)
     num = await Comment.findNumber("count(id)")
     p = Page(num, page_index)
     if num == 0:
         return dict(page=p, comments=())
-    comments = await Comment.findAll(orderBy="created_at desc", limit=(p.offset, p.limit))
+    comments = await Comment.findAll(orderBy="created_at desc", limit=(p.offset, p.limit), defer=True)
     return dict(page=p, comments=comments)
 
 # 用户发表评论API
@@ -157,8 +179,11 @@ async def api_create_comment(id, request, *, content):
     blog = await Blog.find(id)
     if blog is None:
         raise APIResourceNotFoundError("Blog")
-    comment = Comment(blog_id=blog.id, user_id=user.id, user_name=user.name, user_image=user.image, content=content.strip())
+    content = content.strip()
+    comment = Comment(blog_id=blog.id, user_id=user.id, user_name=user.name, user_image=user.image, content=content,
+                      html_content=render_markdown(content))
     await comment.save()
+    pagecache.invalidate("blog:%s" % blog.id)
     return comment
 
 # 管理员删除评论API
@@ -169,11 +194,17 @@ async def api_delete_comments(id, request):
     if c is None:
         raise APIResourceNotFoundError("Comment")
     await c.remove()
+    pagecache.invalidate("blog:%s" % c.blog_id)
     return dict(id=id)
 
 # 获取用户信息API
 @get("/api/users")
-async def api_get_users(*, page="1"):
+async def api_get_users(*, page="1", cursor=None):
+    if cursor is not None:
+        p, users = await find_by_cursor(User, cursor)
+        for u in users:
+            u.passwd = "******"
+        return dict(page=p, users=users)
     page_index = get_page_index(page)
     num = await User.findNumber("count(id)")
     p = Page(num, page_index)
@@ -205,18 +236,21 @@ async def api_register_user(*, email, name, passwd):
     r.set_cookie(COOKIE_NAME, user2cookie(user, 86400), max_age=86400, httponly=True)
     user.passwd = "******"
     r.content_type = "application/json"
-    r.body = json.dumps(user, ensure_ascii=False).encode("utf-8")
+    r.body = serializer.dumps(user)
     return r
 
-# 获取日志列表API
+# 获取日志列表API；默认按游标分页，带page参数时按页码分页(管理页面使用)
 @get("/api/blogs")
-async def api_blogs(*, page="1"):
+async def api_blogs(*, page=None, cursor=None, before=None):
+    if page is None:
+        p, blogs = await find_by_cursor(Blog, cursor, compact=True, before=before)
+        return dict(page=p, blogs=blogs)
     page_index = get_page_index(page)
-    num = await Blog.findNumber("count(id)")
+    num = await Blog.findNumber("count(id)", cache=True)
     p = Page(num, page_index)
     if num == 0:
         return dict(page=p, blogs=())
-    blogs = await Blog.findAll(orderBy="created_at desc", limit=(p.offset, p.limit))
+    blogs = await Blog.findAll(orderBy="created_at desc", limit=(p.offset, p.limit), compact=True, cache=True, defer=True)
     return dict(page=p, blogs=blogs)
 
 # 获取日志详情API
@@ -235,8 +269,9 @@ async def api_create_blog(request, *, name, summary, content):
         raise APIValueError("summary", "summary cannot be empty.")
     if not content or not content.strip():
         raise APIValueError("content", "content cannot be empty.")
-    blog = Blog(user_id=request.__user__.id, user_name=request.__user__.name, user_image=request.__user__.image, name=name.strip(), summary=summary.strip(), content=content.strip())
+    blog = Blog(user_id=request.__user__.id, user_name=request.__user__.name, user_image=request.__user__.image, name=name.strip(), summary=summary.strip(), content=content.strip(), html_content=render_markdown(content.strip()))
     await blog.save()
+    pagecache.invalidate("blogs")
     return blog
 
 # 编辑日志API
@@ -253,7 +288,9 @@ async def api_update_blog(id, request, *, name, summary, content):
     blog.name = name.strip()
     blog.summary = summary.strip()
     blog.content = content.strip()
+    blog.html_content = render_markdown(blog.content)
     await blog.update()
+    pagecache.invalidate("blogs", "blog:%s" % id)
     return blog
 
 # 删除日志API
@@ -262,25 +299,28 @@ async def api_delete_blog(request, *, id):
     check_admin(request)
     blog = await Blog.find(id)
     await blog.remove()
+    pagecache.invalidate("blogs", "blog:%s" % id)
     return dict(id=id)
 
 # 删除用户API
 @post("/api/users/{id}/delete")
 async def api_delete_users(id, request):
     check_admin(request)
-    id_buff = id
     user = await User.find(id)
     if user is None:
         raise APIResourceNotFoundError("Comment")
-    await user.remove()
-    # 给被删除的用户在评论中标记
-    comments = await Comment.findAll("user_id=?",[id])
-    if comments:
-        for comment in comments:
-            id = comment.id
-            c = await Comment.find(id)
-            c.user_name = c.user_name + " (该用户已被删除)"
-            await c.update()
-    id = id_buff
+    # 删除用户和标记其评论在同一个事务中提交
+    async with transaction():
+        await user.remove()
+        # 给被删除的用户在评论中标记
+        await Comment.update_where("user_name=concat(user_name, ?)", "user_id=?", [" (该用户已被删除)", id])
+    # 评论中的用户名可能出现在任意日志页面上
+    pagecache.invalidate()
     return dict(id=id)
-    
\ No newline at end of file
+
+# Prometheus监控指标，包含SQL语句模板等内部信息，只对管理员与携带token的抓取方开放
+@get("/metrics")
+def get_metrics(request):
+    if not metrics.authorized(request.headers.get("Authorization")):
+        check_admin(request)
+    return web.Response(body=metrics.render().encode("utf-8"), content_type="text/plain; version=0.0.4", charset="utf-8")
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Logging pipeline: records are put on a bounded queue by the event loop and
+formatted and written to the rotating log file by a QueueListener thread.
+
+Categories used by the app:
+
+    http.request    per-request lines from the middlewares and RequestHandler
+    orm.sql         every SQL statement and its row count
+"""
+import atexit
+import copy
+import logging
+import os
+import queue
+import random
+
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+import metrics
+
+FORMAT = "%(asctime)s - %(filename)s[line:%(lineno)d] - %(levelname)s: %(message)s"
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    QueueHandler that never blocks the caller. Below WARNING a record is dropped once
+    the queue is past high_water of its capacity, leaving room for warnings and
+    errors, which are only dropped when the queue is full.
+    """
+
+    def __init__(self, maxsize=10000, high_water=0.8):
+        super(BoundedQueueHandler, self).__init__(queue.Queue(maxsize))
+        self.maxsize = maxsize
+        self.high_water = int(maxsize * high_water)
+        self.dropped = dict()  # 级别 -> 丢弃条数
+        self._exc_formatter = logging.Formatter()
+
+    def prepare(self, record):
+        # 级别与采样在入队前已判断，只有真正写出的记录才在这里格式化。
+        # msg % args必须在调用方完成：args中的请求、Model等对象之后还会被事件循环修改。
+        # 时间、文件名等其余字段仍由后台线程拼接；异常信息同样提前格式化，记录不再引用traceback
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        # 先判断是否会被丢弃，被丢弃的记录不做格式化
+        if record.levelno < logging.WARNING and self.queue.qsize() >= self.high_water:
+            self._drop(record)
+            return
+        super(BoundedQueueHandler, self).emit(record)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._drop(record)
+
+    def _drop(self, record):
+        self.dropped[record.levelname] = self.dropped.get(record.levelname, 0) + 1
+
+
+class SampleFilter(logging.Filter):
+    """
+    Keeps a random fraction rate of the records below WARNING.
+    """
+
+    def __init__(self, rate):
+        super(SampleFilter, self).__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+_handler = None
+_listener = None
+
+def default_file():
+    return os.path.join(os.path.dirname(os.getcwd()), 'logs', 'log')
+
+def setup(file=None, max_bytes=100 * 1024 * 1024, backup_count=10, level='INFO', queue_size=10000, categories=None):
+    global _handler, _listener
+    if file is None:
+        file = default_file()
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    fh = RotatingFileHandler(file, maxBytes=max_bytes, backupCount=backup_count)
+    fh.setLevel(logging.DEBUG)
+    fh.setFormatter(logging.Formatter(FORMAT))
+    _handler = BoundedQueueHandler(queue_size)
+    _listener = QueueListener(_handler.queue, fh, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown)
+    root = logging.getLogger()
+    root.setLevel(level)
+    # fork出的子进程中重新setup：继承来的后台线程已不存在，换成新的队列与线程
+    for h in [h for h in root.handlers if isinstance(h, BoundedQueueHandler)]:
+        root.removeHandler(h)
+    root.addHandler(_handler)
+    # 按类别设置级别与采样率，例如{'orm.sql': {'level': 'INFO', 'sample': 0.01}}
+    for name, options in (categories or {}).items():
+        logger = logging.getLogger(name)
+        logger.setLevel(options.get('level', level))
+        for f in [f for f in logger.filters if isinstance(f, SampleFilter)]:
+            logger.removeFilter(f)
+        rate = options.get('sample', 1.0)
+        if rate < 1.0:
+            logger.addFilter(SampleFilter(rate))
+    logging.info(f"logging to {file} via background thread, queue_size={queue_size}")
+    return _handler
+
+def shutdown():
+    # 停止后台线程前会先写完队列中剩余的记录
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+        logging.getLogger().removeHandler(_handler)
+
+_m_log_dropped = metrics.Counter('log_records_dropped_total', 'Log records dropped because the log queue was full.',
+                                 ('level',), fn=lambda: {(k,): v for k, v in (_handler.dropped if _handler else {}).items()})
+_m_log_queue = metrics.Gauge('log_queue_depth', 'Log records waiting for the writer thread.',
+                             fn=lambda: _handler.queue.qsize() if _handler else 0)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+LRU base class shared by the statement, query, page and session caches.
+"""
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Ordered map of key -> entry with LRU eviction, bounded by entry count (maxsize)
+    and/or total entry size (max_bytes), counting hits, misses, evictions and
+    expirations. Subclasses define what an entry is through expired(), sizeof()
+    and removed().
+    """
+
+    def __init__(self, maxsize=None, max_bytes=None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def items(self):
+        # 不改变使用顺序，也不计入命中
+        return list(self._entries.items())
+
+    def expired(self, entry):
+        return False
+
+    def sizeof(self, entry):
+        return 0
+
+    def removed(self, key, entry):
+        # 条目因淘汰、过期或失效被移除后调用，子类在这里维护自己的索引
+        pass
+
+    def lookup(self, key):
+        # 返回未过期的条目并标记为最近使用，不存在时返回None
+        entry = self._entries.get(key)
+        if entry is not None and self.expired(entry):
+            self.expirations += 1
+            self.discard(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry
+
+    def add(self, key, entry):
+        self.discard(key)
+        self._entries[key] = entry
+        self.bytes += self.sizeof(entry)
+        while self._entries and ((self.maxsize and len(self._entries) > self.maxsize)
+                                 or (self.max_bytes and self.bytes > self.max_bytes)):
+            self.evictions += 1
+            self.discard(next(iter(self._entries)))
+        return entry
+
+    def discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= self.sizeof(entry)
+            self.removed(key, entry)
+        return entry
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        stats = dict(entries=len(self._entries), maxsize=self.maxsize, hits=self.hits, misses=self.misses,
+                     evictions=self.evictions, expirations=self.expirations,
+                     hit_ratio=self.hits / lookups if lookups else 0.0)
+        if self.max_bytes:
+            stats.update(bytes=self.bytes, max_bytes=self.max_bytes)
+        return stats
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Minimal in-process metrics registry rendered in the Prometheus text format.
+"""
+import bisect
+import hmac
+import threading
+
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 5000, 10000)
+
+_registry = []
+_lock = threading.Lock()
+_token = None
+
+
+def configure(token=None):
+    global _token
+    _token = token
+
+def authorized(header):
+    # 抓取方的Authorization请求头是否携带了配置的token
+    if not _token or not header:
+        return False
+    return hmac.compare_digest(header.encode('utf-8'), ('Bearer ' + _token).encode('utf-8'))
+
+
+class Metric(object):
+    """
+    Base metric. Label values are passed positionally in the order of labelnames.
+    A metric created with fn is computed at scrape time: fn returns a number or
+    a dict mapping label value tuples to numbers.
+    """
+    type = 'untyped'
+
+    def __init__(self, name, help, labelnames=(), fn=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+        self._values = dict()
+        with _lock:
+            _registry.append(self)
+
+    def samples(self):
+        if self.fn is not None:
+            values = self.fn()
+            if not isinstance(values, dict):
+                values = {(): values}
+        else:
+            values = self._values
+        for labels, value in list(values.items()):
+            yield self.name, labels, value
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, *labels):
+        self._values[labels] = value
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super(Histogram, self).__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        state = self._values.get(labels)
+        if state is None:
+            # [每个桶的计数..., +Inf计数, 总和]
+            state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def samples(self):
+        for labels, state in list(self._values.items()):
+            count = 0
+            for i, bound in enumerate(self.buckets + (float('inf'),)):
+                count += state[i]
+                yield self.name + '_bucket', labels + (('le', _format(bound)),), count
+            yield self.name + '_sum', labels, state[-1]
+            yield self.name + '_count', labels, count
+
+    def count(self, *labels):
+        state = self._values.get(labels)
+        return sum(state[:-1]) if state else 0
+
+
+def _format(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return '%s.0' % int(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def render():
+    lines = []
+    for metric in list(_registry):
+        lines.append('# HELP %s %s' % (metric.name, metric.help))
+        lines.append('# TYPE %s %s' % (metric.name, metric.type))
+        for name, labels, value in metric.samples():
+            pairs = []
+            for i, label in enumerate(labels):
+                # Histogram的le标签以(name, value)形式追加在普通标签之后
+                if isinstance(label, tuple):
+                    pairs.append('%s="%s"' % (label[0], _escape(label[1])))
+                else:
+                    pairs.append('%s="%s"' % (metric.labelnames[i], _escape(label)))
+            lines.append('%s%s %s' % (name, '{%s}' % ','.join(pairs) if pairs else '', _format(value)))
+    return '\n'.join(lines) + '\n'
@@ -14,12 +14,12 @@ class User(Model):
     __table__ = 'users'
 
     id = StringField(primary_key=True, default=next_id, ddl='varchar(50)')
-    email = StringField(ddl='varchar(50)')
+    email = StringField(ddl='varchar(50)', unique=True)
     passwd = StringField(ddl='varchar(50)')
     admin = BooleanField()
     name = StringField(ddl='varchar(50)')
     image = StringField(ddl='varchar(500)')
-    created_at = FloatField(default=time.time)
+    created_at = FloatField(default=time.time, index=True)
 
 
 class Blog(Model):
@@ -32,16 +32,20 @@ class Blog(Model):
     name = StringField(ddl='varchar(50)')
     summary = StringField(ddl='varchar(200)')
     content = TextField()
-    created_at = FloatField(default=time.time)
+    html_content = TextField(default='', deferred=True)  # content渲染后的HTML，列表查询不读取
+    created_at = FloatField(default=time.time, index=True)
 
 
 class Comment(Model):
     __table__ = 'comments'
+    # get_blog按blog_id取评论并按created_at排序
+    __indexes__ = (('blog_id', 'created_at'),)
 
     id = StringField(primary_key=True, default=next_id, ddl='varchar(50)')
     blog_id = StringField(ddl='varchar(50)')
-    user_id = StringField(ddl='varchar(50)')
+    user_id = StringField(ddl='varchar(50)', index=True)
     user_name = StringField(ddl='varchar(50)')
     user_image = StringField(ddl='varchar(500)')
     content = TextField()
-    created_at = FloatField(default=time.time)
\ No newline at end of file
+    html_content = TextField(default='', deferred=True)  # content渲染后的HTML，列表查询不读取
+    created_at = FloatField(default=time.time, index=True)
@@ -2,16 +2,180 @@
 # -*- coding: utf-8 -*-
 import asyncio
 import logging
+import re
+import sys
+import time
 import aiomysql
 
+from collections import deque
+from contextvars import Context, ContextVar
+
+import metrics
+from lru import LRUCache
+
+
+# SQL日志单独归类，可按configs.logging.categories降低级别或采样
+sql_log = logging.getLogger("orm.sql")
 
 def log(sql, args=()):
-    logging.info(f"SQL:{sql}")
+    sql_log.info("SQL:%s", sql)
 
-async def create_pool(loop, **kw):
-    logging.info("create database connection pool...")
-    global __pool
-    __pool = await aiomysql.create_pool(
+
+class StatementCache(LRUCache):
+    """
+    Bounded LRU cache of compiled statements, counting hits and misses.
+    """
+
+    def __init__(self, maxsize=256):
+        super(StatementCache, self).__init__(maxsize)
+
+    def get(self, key):
+        return self.lookup(key)
+
+    def put(self, key, sql):
+        return self.add(key, sql)
+
+    def clear(self):
+        super(StatementCache, self).clear()
+        self.hits = self.misses = 0
+
+
+# 已编译语句的缓存：同一形状的SQL只翻译一次占位符，之后直接复用驱动可用的SQL
+_statements = StatementCache()
+
+def compile_sql(sql):
+    # 将"?"占位符翻译为aiomysql使用的"%s"
+    compiled = _statements.get(sql)
+    if compiled is None:
+        compiled = _statements.put(sql, sql.replace("?", "%s"))
+    return compiled
+
+def statement_cache_stats():
+    return _statements.stats()
+
+
+class QueryCache(LRUCache):
+    """
+    Opt-in cache of query results keyed by (SQL, args), with TTL, LRU eviction and a
+    memory bound. Entries are tagged with their table and dropped on any write to it.
+    """
+
+    def __init__(self, maxsize=1024, max_bytes=16 * 1024 * 1024, ttl=60):
+        super(QueryCache, self).__init__(maxsize, max_bytes)
+        self.ttl = ttl
+        self.invalidations = 0
+        self._tables = dict()  # table -> set(key)
+        self._generations = dict()  # table -> 写入次数，用来丢弃写入前发出的查询结果
+        self._epoch = 0  # 全部失效的次数
+
+    def generation(self, table):
+        return self._epoch, self._generations.get(table, 0)
+
+    def expired(self, entry):
+        return entry[0] < time.time()
+
+    def sizeof(self, entry):
+        return entry[3]
+
+    def removed(self, key, entry):
+        keys = self._tables.get(entry[1])
+        if keys is not None:
+            keys.discard(key)
+
+    def get(self, key):
+        entry = self.lookup(key)
+        return entry[2] if entry is not None else None
+
+    def put(self, key, table, rows, generation):
+        if self.generation(table) != generation:
+            return
+        size = _sizeof(rows)
+        if size > self.max_bytes:
+            return
+        self.add(key, (time.time() + self.ttl, table, rows, size))  # (过期时间, 表, 结果, 大小)
+        self._tables.setdefault(table, set()).add(key)
+
+    def invalidate(self, table=None):
+        if table is None:
+            self.invalidations += len(self)
+            self._epoch += 1
+            self.clear()
+            self._tables.clear()
+            return
+        self._generations[table] = self._generations.get(table, 0) + 1
+        for key in self._tables.pop(table, ()):
+            self.invalidations += 1
+            self.discard(key)
+
+    def stats(self):
+        stats = super(QueryCache, self).stats()
+        stats.update(ttl=self.ttl, invalidations=self.invalidations)
+        return stats
+
+
+def _sizeof(rows):
+    # 粗略估算结果集占用的内存
+    size = sys.getsizeof(rows)
+    for r in rows:
+        size += sys.getsizeof(r)
+        for v in (r.values() if isinstance(r, dict) else r):
+            size += sys.getsizeof(v)
+    return size
+
+_query_cache = None
+_RE_WRITE_TABLE = re.compile(r"^\s*(?:insert\s+(?:ignore\s+)?into|update|delete\s+from|replace\s+into)\s+`?(\w+)`?", re.I)
+
+def enable_query_cache(maxsize=1024, max_bytes=16 * 1024 * 1024, ttl=60):
+    global _query_cache
+    _query_cache = QueryCache(maxsize, max_bytes, ttl)
+    logging.info(f"query cache enabled: maxsize={maxsize}, max_bytes={max_bytes}, ttl={ttl}")
+    return _query_cache
+
+def disable_query_cache():
+    global _query_cache
+    _query_cache = None
+
+def query_cache_stats():
+    return _query_cache.stats() if _query_cache is not None else None
+
+def _table_of(sql):
+    m = _RE_WRITE_TABLE.match(sql)
+    return m.group(1) if m else None
+
+_write_listeners = []
+
+def add_write_listener(fn):
+    # fn(table, pk)在表被写入后调用，用于使ORM之外的缓存失效；table为None表示无法确定写入的表，
+    # 按主键写入单行(Model.save/update/remove)时pk为该行主键，否则为None
+    _write_listeners.append(fn)
+
+def remove_write_listener(fn):
+    _write_listeners.remove(fn)
+
+def invalidate(table, pk=None):
+    # 其他进程写入了table后调用，使本进程中与该表相关的缓存失效；table为None时全部失效
+    _invalidate(table, pk)
+
+def _invalidate(table, pk=None):
+    if _query_cache is not None:
+        _query_cache.invalidate(table)
+    for model, loader in list(_loaders.items()):
+        if table is None or model.__table__ == table:
+            loader.invalidate()
+    for fn in _write_listeners:
+        fn(table, pk)
+
+__pool = None
+__replicas = []
+_read_policy = "round_robin"
+_read_counter = 0
+# 读写一致窗口：某个会话写入后的若干秒内，它的读请求仍然发往主库，避免读到尚未同步的从库
+_read_your_writes = 0
+_recent_writes = dict()
+_session = ContextVar("orm_session", default=None)
+
+async def _create_pool(loop, **kw):
+    return await aiomysql.create_pool(
         host=kw.get("host", "localhost"),
         port=kw.get("port", 3306),
         user=kw["user"],
@@ -21,34 +185,660 @@ async def create_pool(loop, **kw):
         autocommit=kw.get("autocommit", True),
         maxsize=kw.get("maxsize", 10),
         minsize=kw.get("minsize", 1),
+        pool_recycle=kw.get("pool", {}).get("recycle", -1),
         loop=loop
     )
 
+async def create_pool(loop, pool_factory=None, **kw):
+    # configs.db 可以带replicas列表，每一项只需写出和主库不同的配置，如{"host": "10.0.0.2"}
+    # pool_factory(loop, **kw)用来替换aiomysql.create_pool，例如压测时使用benchmarks/standin.py
+    logging.info("create database connection pool...")
+    global _read_policy, _read_your_writes
+    if "statement_cache_size" in kw:
+        _statements.maxsize = kw["statement_cache_size"]
+    if kw.get("query_cache"):
+        enable_query_cache(**kw["query_cache"])
+    if kw.get("batch_loader"):
+        enable_batch_loading(**kw["batch_loader"])
+    set_slow_query_threshold(kw.get("slow_query", 1.0))
+    _read_policy = kw.get("read_policy", "round_robin")
+    _read_your_writes = kw.get("read_your_writes", 5)
+    pool_factory = pool_factory or _create_pool
+    primary = await pool_factory(loop, **kw)
+    replicas = []
+    for replica in kw.get("replicas", ()):
+        logging.info(f"create replica connection pool: {replica.get('host', kw.get('host'))}")
+        replicas.append(await pool_factory(loop, **dict(kw, **replica)))
+    set_pools(primary, replicas)
+    options = kw.get("pool", {})
+    for pool in [primary] + replicas:
+        # warmup与recycle分别在这里和_create_pool中使用，其余交给PoolMaintainer
+        maintainer = PoolMaintainer(pool, _pool_names[pool], options.get("health_interval", 30), options.get("adaptive"))
+        _maintainers.append(maintainer)
+        if options.get("warmup", True):
+            await maintainer.warm_up()
+        maintainer.start()
+
+async def close_pool():
+    # 停止后台维护任务并关闭所有连接池
+    for maintainer in _maintainers:
+        maintainer.stop()
+    _maintainers.clear()
+    for pool in [__pool] + __replicas:
+        if pool is not None:
+            pool.close()
+            await pool.wait_closed()
+
+def set_pools(primary, replicas=()):
+    # 直接指定连接池，本地测试时可以传入指向不同测试库的两个连接池
+    global __pool, __replicas
+    __pool = primary
+    __replicas = list(replicas)
+    _pool_names.clear()
+    _pool_names[primary] = "primary"
+    for i, replica in enumerate(__replicas):
+        _pool_names[replica] = f"replica{i}"
+
+def bind_session(key):
+    # 由请求中间件调用，把当前会话(如用户id)绑定到上下文，用于读写一致判断
+    _session.set(key)
+
+def _reads_primary():
+    # 当前会话是否处于读写一致窗口内
+    key = _session.get()
+    if key is not None and key in _recent_writes:
+        if _recent_writes[key] > time.time():
+            return True
+        del _recent_writes[key]
+    return False
+
+def _read_pool():
+    global _read_counter
+    if not __replicas:
+        return __pool
+    if _reads_primary():
+        return __pool
+    if _read_policy == "least_busy":
+        # 选择正在使用的连接最少的从库
+        return min(__replicas, key=lambda p: p.size - p.freesize)
+    _read_counter += 1
+    return __replicas[_read_counter % len(__replicas)]
+
+def _mark_write():
+    key = _session.get()
+    if key is None or not __replicas or not _read_your_writes:
+        return
+    now = time.time()
+    if len(_recent_writes) > 10000:
+        for k in [k for k, v in _recent_writes.items() if v <= now]:
+            del _recent_writes[k]
+    _recent_writes[key] = now + _read_your_writes
+
+class PoolMaintainer(object):
+    """
+    Validates a pool's initial connections, pings idle connections in the
+    background and, when adaptive bounds are configured, resizes the pool:
+    grow while acquire wait is high, shrink while connections sit idle.
+    """
+
+    def __init__(self, pool, name, health_interval=30, adaptive=None):
+        self.pool = pool
+        self.name = name
+        self.health_interval = health_interval
+        self.adaptive = adaptive
+        # 两次resize之间的等待时间总和与次数，只在自适应时统计
+        self.wait_total = 0.0
+        self.wait_count = 0
+        self.peak_in_use = 0
+        self._idle_ticks = 0
+        self._tasks = []
+
+    async def warm_up(self):
+        # 建池时已经建立了minsize个连接，这里把它们取出来各ping一次，有问题在接流量前就暴露
+        start = time.perf_counter()
+        n = self.pool.minsize
+        conns = []
+        try:
+            for conn in await asyncio.gather(*[self.pool.acquire() for _ in range(n)]):
+                conns.append(conn)
+            await asyncio.gather(*[conn.ping() for conn in conns])
+        finally:
+            for conn in conns:
+                self.pool.release(conn)
+        logging.info(f"pool {self.name} warmed up: {n} connections in {time.perf_counter() - start:.3f}s")
+
+    def start(self):
+        if self.health_interval:
+            self._tasks.append(asyncio.ensure_future(self._health_loop()))
+        if self.adaptive:
+            self._tasks.append(asyncio.ensure_future(self._sizing_loop()))
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def record(self, wait):
+        if not self.adaptive:
+            return
+        self.wait_total += wait
+        self.wait_count += 1
+        in_use = self.pool.size - self.pool.freesize
+        if in_use > self.peak_in_use:
+            self.peak_in_use = in_use
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check()
+            except Exception as e:
+                logging.exception(e)
+
+    async def check(self):
+        # 依次取出当前空闲的连接ping一次，失败的连接关闭后由连接池丢弃
+        bad = 0
+        for _ in range(self.pool.freesize):
+            if not self.pool.freesize:
+                break
+            conn = await self.pool.acquire()
+            try:
+                await asyncio.wait_for(conn.ping(reconnect=False), 5)
+            except Exception:
+                bad += 1
+                conn.close()
+            finally:
+                self.pool.release(conn)
+        if bad:
+            logging.warning(f"pool {self.name}: dropped {bad} stale connections")
+        return bad
+
+    async def _sizing_loop(self):
+        interval = self.adaptive.get("interval", 10)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.resize()
+            except Exception as e:
+                logging.exception(e)
+
+    def resize(self):
+        low = self.adaptive.get("min", self.pool.minsize)
+        high = self.adaptive.get("max", self.pool.maxsize)
+        grow_wait = self.adaptive.get("grow_wait", 0.01)
+        step = self.adaptive.get("step", 2)
+        idle_ticks = self.adaptive.get("idle_ticks", 6)
+        total, count = self.wait_total, self.wait_count
+        self.wait_total, self.wait_count = 0.0, 0
+        peak, self.peak_in_use = self.peak_in_use, self.pool.size - self.pool.freesize
+        maxsize = self.pool.maxsize
+        avg_wait = total / count if count else 0.0
+        target = maxsize
+        if avg_wait > grow_wait and maxsize < high:
+            target = min(high, maxsize + step)
+            self._idle_ticks = 0
+        elif peak <= maxsize // 2:
+            # 连续idle_ticks个周期使用量不到一半才收缩，避免来回抖动
+            self._idle_ticks += 1
+            if self._idle_ticks >= idle_ticks and maxsize > low:
+                target = max(low, maxsize - step, peak)
+                self._idle_ticks = 0
+        else:
+            self._idle_ticks = 0
+        if target != maxsize:
+            logging.info(f"pool {self.name} resize {maxsize} -> {target}: avg acquire wait {avg_wait * 1000:.1f}ms "
+                         f"over {count} acquires, peak in use {peak}")
+            _resize_pool(self.pool, target)
+        return target
+
+
+def _resize_pool(pool, maxsize):
+    # aiomysql的maxsize就是空闲队列的maxlen，只能换一个新队列；要给借出的连接留出归还的位置，
+    # 否则归还时deque会静默挤掉最早的空闲连接而不关闭它。多出的空闲连接先关闭
+    free = pool._free
+    while len(free) > max(0, maxsize - len(pool._used)):
+        free.popleft().close()
+    pool._free = deque(free, maxlen=maxsize)
+    # 唤醒在等待连接的协程，让它们按新的上限建立连接
+    asyncio.ensure_future(_notify_waiters(pool))
+
+async def _notify_waiters(pool):
+    async with pool._cond:
+        pool._cond.notify_all()
+
+_maintainers = []
+
+def _record_acquire(pool, wait):
+    for maintainer in _maintainers:
+        if maintainer.pool is pool:
+            maintainer.record(wait)
+            return
+
 async def select(sql, args, size=None):
+    return await _select(sql, compile_sql(sql), args, size)
+
+async def execute(sql, args, autocommit=True):
+    _forget_all()
+    return await _execute(sql, compile_sql(sql), args, autocommit=autocommit)
+
+async def execute_many(sql, args_list):
+    _forget_all()
+    return await _execute_many(sql, compile_sql(sql), args_list)
+
+# 连接池与查询的监控指标，通过/metrics以Prometheus文本格式导出
+_pool_names = dict()
+_slow_query = 1.0
+
+def _pool_gauge():
+    values = dict()
+    for pool, name in list(_pool_names.items()):
+        values[(name, "in_use")] = pool.size - pool.freesize
+        values[(name, "free")] = pool.freesize
+        values[(name, "max")] = pool.maxsize
+    return values
+
+_m_pool_connections = metrics.Gauge("db_pool_connections", "Connections per pool by state.", ("pool", "state"), fn=_pool_gauge)
+_m_pool_wait = metrics.Histogram("db_pool_acquire_seconds", "Time spent waiting for a pooled connection.", ("pool",))
+_m_query_seconds = metrics.Histogram("db_query_seconds", "Statement latency by statement template.", ("statement",))
+_m_query_rows = metrics.Histogram("db_query_rows", "Rows returned or affected by statement template.", ("statement",), buckets=metrics.SIZE_BUCKETS)
+_m_slow_queries = metrics.Counter("db_slow_queries_total", "Statements slower than the slow query threshold.", ("statement",))
+_m_statement_cache = metrics.Counter("db_statement_cache_total", "Compiled statement cache lookups.", ("result",),
+                                     fn=lambda: {("hit",): _statements.hits, ("miss",): _statements.misses})
+_m_query_cache = metrics.Counter("db_query_cache_total", "Query result cache lookups and removals.", ("result",),
+                                 fn=lambda: {(k,): v for k, v in (query_cache_stats() or {}).items()
+                                             if k in ("hits", "misses", "evictions", "expirations", "invalidations")})
+_m_identity_map = metrics.Counter("db_identity_map_total", "Identity map queries issued and saved.", ("result",),
+                                  fn=lambda: {("queries",): _identity_totals["queries"], ("saved",): _identity_totals["saved"]})
+
+def set_slow_query_threshold(seconds):
+    global _slow_query
+    _slow_query = seconds
+
+
+class _Acquire(object):
+    # 从连接池取连接，同时记录等待连接的时间
+    def __init__(self, pool):
+        self._pool = pool
+        self._cm = None
+        self._conn = None
+
+    async def __aenter__(self):
+        start = time.perf_counter()
+        self._cm = self._pool.acquire()
+        conn = self._conn = await self._cm.__aenter__()
+        wait = time.perf_counter() - start
+        _m_pool_wait.observe(wait, _pool_names.get(self._pool, "unknown"))
+        if _maintainers:
+            _record_acquire(self._pool, wait)
+        return conn
+
+    async def __aexit__(self, exc_type, exc, tb):
+        # 连接池收缩后借出的连接可能多于新上限，空闲队列已满时关闭而不是归还
+        pool = self._pool
+        if not self._conn.closed and len(pool._free) >= pool.maxsize:
+            self._conn.close()
+        return await self._cm.__aexit__(exc_type, exc, tb)
+
+
+class _Pinned(object):
+    # 事务中直接使用已绑定的连接，用完不归还连接池
+    def __init__(self, conn):
+        self._conn = conn
+
+    async def __aenter__(self):
+        return self._conn
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+class _TransactionState(object):
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.depth = 0
+        self.writes = set()  # 事务中的写入(表, 主键)，提交后再次使缓存失效
+
+
+_tx = ContextVar("orm_transaction", default=None)
+
+def _connection(pool):
+    state = _tx.get()
+    if state is not None:
+        return _Pinned(state.conn)
+    return _Acquire(pool)
+
+def _primary():
+    return __pool
+
+async def _run_sql(conn, sql):
+    cur = await conn.cursor()
+    await cur.execute(sql)
+    await cur.close()
+
+
+class transaction(object):
+    """
+    Explicit transaction pinned to one pooled connection:
+
+        async with orm.transaction():
+            await user.remove()
+            await Comment.update_where(...)
+
+    Model methods in the block run on that connection and commit or roll back once.
+    Nested blocks become savepoints. Statements in one transaction share a single
+    connection, so do not run them concurrently (e.g. with asyncio.gather).
+    """
+
+    def __init__(self):
+        self._state = None
+        self._savepoint = None
+        self._acquire = None
+        self._token = None
+
+    async def __aenter__(self):
+        state = _tx.get()
+        if state is not None:
+            state.depth += 1
+            self._state = state
+            self._savepoint = f"sp_{state.depth}"
+            await _run_sql(state.conn, "savepoint " + self._savepoint)
+            return self
+        self._acquire = _Acquire(_primary())
+        conn = await self._acquire.__aenter__()
+        try:
+            await conn.begin()
+        except BaseException:
+            await self._acquire.__aexit__(*sys.exc_info())
+            raise
+        self._state = _TransactionState(conn)
+        self._token = _tx.set(self._state)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        state = self._state
+        if self._savepoint is not None:
+            try:
+                if exc_type is None:
+                    await _run_sql(state.conn, "release savepoint " + self._savepoint)
+                else:
+                    await _run_sql(state.conn, "rollback to savepoint " + self._savepoint)
+                    _forget_all()
+            finally:
+                state.depth -= 1
+            return False
+        _tx.reset(self._token)
+        try:
+            if exc_type is None:
+                await state.conn.commit()
+            else:
+                await state.conn.rollback()
+                _forget_all()
+        finally:
+            await self._acquire.__aexit__(exc_type, exc, tb)
+            for table, pk in state.writes:
+                _invalidate(table, pk)
+        return False
+
+
+def _observe(sql, start, rows, args=None):
+    elapsed = time.perf_counter() - start
+    _m_query_seconds.observe(elapsed, sql)
+    _m_query_rows.observe(rows, sql)
+    if _slow_query is not None and elapsed >= _slow_query:
+        _m_slow_queries.inc(sql)
+        # 参数里可能有密码摘要、邮箱等，只记录个数
+        logging.warning(f"slow query ({elapsed:.3f}s, {rows} rows): {sql} ({len(args) if args else 0} args)")
+
+def _forget_all():
+    # 直接执行的SQL不知道影响了哪张表，清空当前请求的identity map
+    imap = _identity.get()
+    if imap is not None:
+        imap.clear()
+
+# _select和_execute接收已编译的SQL，Model内部直接使用，省去每次查询的占位符翻译
+async def _select(sql, compiled, args, size=None, cursor=aiomysql.DictCursor):
     log(sql, args)
-    with (await __pool) as conn:
-        cur = await conn.cursor(aiomysql.DictCursor)
-        await cur.execute(sql.replace("?", "%s"), args or ())
+    async with _connection(_read_pool()) as conn:
+        start = time.perf_counter()
+        cur = await conn.cursor(cursor)
+        await cur.execute(compiled, args or ())
         if size:
             rs = await cur.fetchmany(size)  # 一次性返回size条查询结果，结果是一个list，里面是tuple
         else:
             rs = await cur.fetchall()  # 一次性返回所有的查询结果
         await cur.close()
-        logging.info(f"row returned: {len(rs)}")
+        _observe(sql, start, len(rs), args)
+        sql_log.info("row returned: %d", len(rs))
         return rs
 
-async def execute(sql, args, autocommit=True):
+async def _cached_select(table, sql, compiled, args, size=None, cursor=aiomysql.DictCursor):
+    # 查询结果缓存，缓存项以表名为标签，表上的任何写入都会使其失效
+    # 事务中可能读到未提交的数据，既不读也不写进程共享的缓存
+    if _query_cache is None or _tx.get() is not None:
+        return await _select(sql, compiled, args, size, cursor)
+    key = (compiled, tuple(args) if args else (), size, cursor)
+    rs = _query_cache.get(key)
+    if rs is None:
+        generation = _query_cache.generation(table)
+        rs = await _select(sql, compiled, args, size, cursor)
+        _query_cache.put(key, table, rs, generation)
+    return rs
+
+async def _execute(sql, compiled, args, table=None, autocommit=True, pk=None):
     log(sql)
-    with (await __pool) as conn:
+    _mark_write()
+    table = table or _table_of(sql)
+    state = _tx.get()
+    if state is not None:
+        state.writes.add((table, pk))
+    async with _connection(__pool) as conn:
+        start = time.perf_counter()
+        # autocommit=False且不在事务中时，单独为这条语句开启事务
+        own = not autocommit and state is None
         try:
+            if own:
+                await conn.begin()
             cur = await conn.cursor()
-            await cur.execute(sql.replace("?", "%s"), args)
+            await cur.execute(compiled, args)
             affected = cur.rowcount
             await cur.close()
+            if own:
+                await conn.commit()
         except BaseException as e:
+            if own:
+                await conn.rollback()
             raise
+        finally:
+            _invalidate(table, pk)
+        _observe(sql, start, affected, args)
         return affected
 
+async def _execute_many(sql, compiled, args_list, table=None):
+    # 同一条语句批量执行多组参数，INSERT会被驱动合并为一条多行INSERT
+    log(sql)
+    _mark_write()
+    table = table or _table_of(sql)
+    state = _tx.get()
+    if state is not None:
+        state.writes.add((table, None))
+    async with _connection(__pool) as conn:
+        start = time.perf_counter()
+        try:
+            cur = await conn.cursor()
+            await cur.executemany(compiled, args_list)
+            affected = cur.rowcount
+            await cur.close()
+        finally:
+            _invalidate(table)
+        _observe(sql, start, affected)
+        return affected
+
+async def _iterate(sql, compiled, args, batch_size):
+    # 使用非缓冲的服务端游标，每次只从网络读取batch_size行，内存占用与结果集大小无关
+    log(sql, args)
+    pinned = _tx.get() is not None
+    async with _connection(_read_pool()) as conn:
+        cur = await conn.cursor(aiomysql.SSDictCursor)
+        done = False
+        try:
+            await cur.execute(compiled, args or ())
+            while True:
+                rs = await cur.fetchmany(batch_size)
+                if not rs:
+                    break
+                yield rs
+            done = True
+        finally:
+            if done or pinned:
+                # 事务中的连接不能关闭，只能把剩余的行读完
+                await cur.close()
+            else:
+                # 提前退出时剩余的行尚未读完，关闭游标会把它们全部读掉；
+                # 直接关闭连接，连接池在归还时会丢弃已关闭的连接
+                conn.close()
+
+
+class IdentityMap(object):
+    """
+    Request scoped map of loaded rows, keyed by table and primary key.
+    """
+
+    # 标记主键在库中不存在，find可以直接返回None
+    MISSING = object()
+
+    def __init__(self):
+        self.rows = dict()
+        self.results = dict()
+        self.queries = 0
+        self.saved = 0
+
+    def get(self, table, pk):
+        return self.rows.get((table, pk))
+
+    def put(self, table, pk, row):
+        self.rows[(table, pk)] = row
+
+    def invalidate(self, table):
+        # 对表的集合写入无法确定影响了哪些行，整表失效
+        self.rows = {k: v for k, v in self.rows.items() if k[0] != table}
+        self.results = {k: v for k, v in self.results.items() if k[0] != table}
+
+    def clear(self):
+        self.rows.clear()
+        self.results.clear()
+
+
+_identity = ContextVar("orm_identity_map", default=None)
+_identity_totals = dict(requests=0, queries=0, saved=0)
+
+def begin_identity_map():
+    # 由请求中间件调用，返回的token交给end_identity_map
+    return _identity.set(IdentityMap())
+
+def end_identity_map(token):
+    imap = _identity.get()
+    _identity.reset(token)
+    _identity_totals["requests"] += 1
+    _identity_totals["queries"] += imap.queries
+    _identity_totals["saved"] += imap.saved
+    return imap
+
+def identity_map_stats():
+    return dict(_identity_totals)
+
+
+class BatchLoader(object):
+    """
+    Coalesces Model.find calls issued in the same event loop tick into one
+    SELECT ... WHERE pk IN (...). Concurrent callers of one key share a future
+    until a write to the table, after which they start a new batch.
+    """
+
+    def __init__(self, model, window=0, max_batch=100):
+        self.model = model
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.keys = 0
+        self._pending = dict()  # pk -> future，尚未发出的查询
+        self._inflight = dict()  # pk -> future，已发出尚未返回的查询
+        self._handle = None
+
+    def load(self, pk):
+        fut = self._pending.get(pk) or self._inflight.get(pk)
+        if fut is not None:
+            return fut
+        loop = asyncio.get_event_loop()
+        fut = loop.create_future()
+        self._pending[pk] = fut
+        if len(self._pending) >= self.max_batch:
+            self._dispatch()
+        elif self._handle is None:
+            if self.window:
+                self._handle = loop.call_later(self.window, self._dispatch)
+            else:
+                self._handle = loop.call_soon(self._dispatch)
+        return fut
+
+    def _dispatch(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        batch, self._pending = self._pending, dict()
+        if batch:
+            self._inflight.update(batch)
+            # 在空白上下文中发出查询，不沿用某个调用者的会话或事务连接
+            asyncio.get_event_loop().call_soon(asyncio.ensure_future, self._run(batch), context=Context())
+
+    async def _run(self, batch):
+        self.batches += 1
+        self.keys += len(batch)
+        try:
+            rows = await self.model._find_many(list(batch))
+        except Exception as e:
+            for fut in batch.values():
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        finally:
+            for pk, fut in batch.items():
+                # 写入后_inflight可能已被替换，只移除本批次自己的future
+                if self._inflight.get(pk) is fut:
+                    del self._inflight[pk]
+        pk_name = self.model.__primary_key__
+        found = {r[pk_name]: r for r in rows}
+        for pk, fut in batch.items():
+            if not fut.done():
+                fut.set_result(found.get(pk))
+
+    def invalidate(self):
+        # 写入前发出的查询可能返回旧数据：尚未发出的批次立即发出，之后的调用者不再共享已发出的future
+        self._dispatch()
+        self._inflight = dict()
+
+    def stats(self):
+        return dict(batches=self.batches, keys=self.keys, window=self.window, max_batch=self.max_batch)
+
+
+_loaders = dict()
+_loader_options = None
+
+def enable_batch_loading(window=0, max_batch=100):
+    # 开启后Model.find经由BatchLoader合并查询；window为收集窗口(秒)，0表示只合并同一轮事件循环
+    global _loader_options
+    _loader_options = dict(window=window, max_batch=max_batch)
+    _loaders.clear()
+    logging.info(f"batch loading enabled: window={window}, max_batch={max_batch}")
+
+def disable_batch_loading():
+    global _loader_options
+    _loader_options = None
+    _loaders.clear()
+
+def batch_loader_stats():
+    return {model.__name__: loader.stats() for model, loader in _loaders.items()}
+
 
 # 在当前类中查找所有的类属性(attrs)，如果找到Field属性，就将其保存到__mappings__的dict中，
 # 同时从类属性中删除Field(防止实例属性遮住类的同名属性)
@@ -82,18 +872,88 @@ class ModelMetaclass(type):
         for k in mappings.keys():
             attrs.pop(k)
 
+        # 索引：字段上的index/unique声明加上__indexes__中的联合索引，如(("blog_id", "created_at"),)
+        # __indexes__的每一项也可以写成dict(columns=(...), unique=True, name="...")
+        indexes = []
+        for k, v in mappings.items():
+            if v.index and not v.primary_key:
+                indexes.append(_make_index(tablename, (k,), v.unique))
+        for index in attrs.get("__indexes__", ()):
+            if isinstance(index, dict):
+                indexes.append(_make_index(tablename, tuple(index["columns"]), index.get("unique", False), index.get("name")))
+            else:
+                indexes.append(_make_index(tablename, tuple(index), False))
+        for index in indexes:
+            for c in index["columns"]:
+                if c not in mappings:
+                    raise RuntimeError(f"Index {index['name']} refers to unknown field: {c}")
+
         # 使用反单引号" ` "区别MySQL保留字，提高兼容性
         escaped_fields = list(map(lambda f: "`%s`" % f, fields))
         attrs["__mappings__"] = mappings  # 保存属性和列的映射关系
         attrs["__table__"] = tablename
         attrs["__primary_key__"] = primarykey  # 主键属性名
         attrs["__fields__"] = fields  # 除主键外的属性名
+        attrs["__indexes__"] = indexes
         # 构造默认的SELECT, INSERT, UPDATE和DELETE语句:
         attrs["__select__"] = "SELECT `%s`, %s FROM `%s`" % (primarykey, ",".join(escaped_fields), tablename)
         attrs["__insert__"] = "insert into `%s` (%s, `%s`) values (%s)" % (tablename, ", ".join(escaped_fields), primarykey, create_args_string(len(escaped_fields) + 1))
         attrs["__update__"] = "update `%s` set %s where `%s`=?" % (tablename, ", ".join(map(lambda f: "`%s`=?" % (mappings.get(f).name or f), fields)), primarykey)
         attrs["__delete__"] = "delete from `%s` where `%s`=?" % (tablename, primarykey)
-        return type.__new__(cls, name, bases, attrs)
+        # 列表查询不需要的大字段声明为deferred，findAll(defer=True)时使用不含这些列的语句
+        listed = [f for f in fields if not mappings[f].deferred]
+        attrs["__select_listed__"] = "SELECT `%s`, %s FROM `%s`" % (primarykey, ",".join("`%s`" % f for f in listed), tablename)
+        find = "%s where `%s`=?" % (attrs["__select__"], primarykey)
+        attrs["__find__"] = (find, find.replace("?", "%s"))
+        # 默认语句在建类时就编译好，save/update/remove不再做任何字符串处理
+        attrs["__compiled__"] = {k: (attrs[f"__{k}__"], attrs[f"__{k}__"].replace("?", "%s")) for k in ("insert", "update", "delete")}
+        model = type.__new__(cls, name, bases, attrs)
+        # 紧凑的行类型，列顺序与__select__一致，可直接由驱动返回的tuple构造
+        model.__row__ = make_row_class(name, [primarykey] + fields, model)
+        model.__row_listed__ = model.__row__ if listed == fields else make_row_class(name + "Listed", [primarykey] + listed, model)
+        return model
+
+
+def _make_index(table, columns, unique, name=None):
+    return dict(name=name or "idx_%s_%s" % (table, "_".join(columns)), columns=columns, unique=unique)
+
+
+class Row(object):
+    """
+    Base of the slotted row types generated for each model.
+    """
+    __slots__ = ()
+    __columns__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        return self.__columns__
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in self.__columns__}
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, ", ".join("%s=%r" % (k, getattr(self, k)) for k in self.__columns__))
+
+
+def make_row_class(name, columns, model):
+    # 与collections.namedtuple相同的做法，生成按位置赋值的__init__，避免逐列的通用循环
+    namespace = {}
+    exec("def __init__(self, %s):\n%s" % (", ".join(columns), "\n".join("    self.%s = %s" % (c, c) for c in columns)), namespace)
+    return type(f"{name}Row", (Row,), dict(
+        __slots__=tuple(columns),
+        __columns__=tuple(columns),
+        __model__=model,
+        __init__=namespace["__init__"],
+    ))
 
 
 class Model(dict, metaclass=ModelMetaclass):
@@ -124,83 +984,305 @@ class Model(dict, metaclass=ModelMetaclass):
         return value
 
     @classmethod
-    async def findAll(cls, where=None, args=None, **kw):
-        # 根据WHERE条件查找
-        sql = [cls.__select__]
+    def create_table_sql(cls):
+        # 按字段与索引声明生成MySQL建表语句
+        lines = []
+        for k, v in cls.__mappings__.items():
+            lines.append("    `%s` %s not null" % (v.name or k, v.column_type))
+        lines.append("    primary key (`%s`)" % cls.__primary_key__)
+        for index in cls.__indexes__:
+            lines.append("    %s `%s` (%s)" % ("unique key" if index["unique"] else "key", index["name"],
+                                               ", ".join("`%s`" % c for c in index["columns"])))
+        return "create table `%s` (\n%s\n) engine=innodb default charset=utf8;" % (cls.__table__, ",\n".join(lines))
+
+    @classmethod
+    def _statement(cls, key, build):
+        # 按语句形状(表, 类型, where模板, orderby, limit形式)缓存编译结果
+        key = (cls.__table__,) + key
+        sql = _statements.get(key)
+        if sql is None:
+            sql = build()
+            sql = _statements.put(key, (sql, sql.replace("?", "%s")))
+        return sql
+
+    @classmethod
+    def _build_select(cls, where, orderby, limit, defer=False):
+        sql = [cls.__select_listed__ if defer else cls.__select__]
         if where:
             sql.append("where")
             sql.append(where)
-        if args is None:
-            args = []
-
-        orderby = kw.get("orderby", None)
         if orderby:
             sql.append("order by")
             sql.append(orderby)
+        if limit == 1:
+            # 如果limit为一个整数n，那就将查询结果的前n个结果返回
+            sql.append("limit ?")
+        elif limit == 2:
+            # 如果limit为一个两个值的tuple，则前一个值代表索引，后一个值代表从这个索引开始要取的结果数
+            sql.append("limit ?, ?")
+        return " ".join(sql)
 
+    @classmethod
+    def _build_keyset(cls, seek, desc):
+        # (c1, c2) < (?, ?) 展开为 c1<? or (c1=? and c2<?)，以便MySQL在联合索引上做范围扫描
+        op = "<" if desc else ">"
+        terms = []
+        for k in range(len(seek)):
+            cond = ["`%s`=?" % c for c in seek[:k]]
+            cond.append("`%s`%s?" % (seek[k], op))
+            terms.append("(%s)" % " and ".join(cond))
+        return "(%s)" % " or ".join(terms)
+
+    @classmethod
+    def _prepare_findAll(cls, where=None, args=None, **kw):
+        # 生成findAll的语句与参数，不执行；schema.py用它来EXPLAIN查询
+        args = list(args) if args else []
+        orderby = kw.get("orderby", None)
         limit = kw.get("limit", None)
+        # 键集分页: seek给出排序列(如("created_at", "id"))，after为上一页最后一行在这些列上的值
+        seek = kw.get("seek", None)
+        after = kw.get("after", None)
+        desc = kw.get("desc", True)
+        defer = kw.get("defer", False)
+        if seek:
+            seek = tuple(seek)
+            orderby = ", ".join("`%s` %s" % (c, "desc" if desc else "asc") for c in seek)
+            if after is not None:
+                if len(after) != len(seek):
+                    raise ValueError(f"Invalid seek value: {str(after)}")
+                for k in range(len(seek)):
+                    args.extend(after[:k])
+                    args.append(after[k])
+        limit_form = None
         if limit is not None:
-            sql.append("limit")
             if isinstance(limit, int):
-                # 如果limit为一个整数n，那就将查询结果的前n个结果返回
-                sql.append("?")
+                limit_form = 1
                 args.append(limit)
             elif isinstance(limit, tuple) and len(limit) == 2:
-                # 如果limit为一个两个值的tuple，则前一个值代表索引，后一个值代表从这个索引开始要取的结果数
-                sql.append("?, ?")
+                limit_form = 2
                 args.extend(limit)  # 用extend是把tuple的小括号去掉
             else:
                 raise ValueError(f"Invalid limit value: {str(limit)}")
-        rs = await select(" ".join(sql), args)  # 返回的rs是一个元素是tuple的list
+
+        def build():
+            w = where
+            if seek and after is not None:
+                keyset = cls._build_keyset(seek, desc)
+                w = "(%s) and %s" % (where, keyset) if where else keyset
+            return cls._build_select(w, orderby, limit_form, defer)
+        sql, compiled = cls._statement(("findAll", where, orderby, limit_form, seek, after is not None, defer), build)
+        return sql, compiled, args
+
+    @classmethod
+    async def findAll(cls, where=None, args=None, **kw):
+        # 根据WHERE条件查找
+        sql, compiled, args = cls._prepare_findAll(where, args, **kw)
+        # compact=True时返回__row__实例(只读的紧凑行)，不经过DictCursor和dict
+        compact = kw.get("compact", False)
+        # cache=True时使用查询结果缓存(需先enable_query_cache)
+        cache = kw.get("cache", False)
+        # defer=True时不读取deferred列(如html_content)，用于列表；这样读出的实例不要再update
+        defer = kw.get("defer", False)
+        imap = _identity.get()
+        if imap is not None:
+            # 同一请求内相同的查询直接复用，返回新的实例，避免调用者之间互相修改
+            key = (cls.__table__, compiled, tuple(args), compact)
+            rs = imap.results.get(key)
+            if rs is not None:
+                imap.saved += 1
+                return cls._rows(rs, compact, defer)
+            imap.queries += 1
+        cursor = aiomysql.Cursor if compact else aiomysql.DictCursor
+        if cache:
+            rs = await _cached_select(cls.__table__, sql, compiled, args, cursor=cursor)
+        else:
+            rs = await _select(sql, compiled, args, cursor=cursor)  # 返回的rs是一个元素是dict(compact时为tuple)的list
+        if imap is not None:
+            imap.results[key] = rs
+            if not compact and not defer:
+                # 缺少deferred列的行不放入身份映射，避免之后的find拿到不完整的行
+                pk = cls.__primary_key__
+                for r in rs:
+                    if pk in r:
+                        imap.put(cls.__table__, r[pk], r)
+        return cls._rows(rs, compact, defer)
+
+    @classmethod
+    def _rows(cls, rs, compact, defer=False):
+        if compact:
+            row = cls.__row_listed__ if defer else cls.__row__
+            return [row(*r) for r in rs]
         return [cls(**r) for r in rs]  # **r是关键字参数，构成了一个cls类的列表，其实就是每一条记录对应的类实例
 
     @classmethod
-    async def findNumber(cls, selectfield, where=None, args=None):
+    async def iterate(cls, where=None, args=None, batch_size=100, batches=False, **kw):
+        # 流式遍历查询结果：async for blog in Blog.iterate(...)，batches=True时每次产出一批
+        orderby = kw.get("orderby", None)
+        sql, compiled = cls._statement(("iterate", where, orderby),
+                                       lambda: cls._build_select(where, orderby, None))
+        rows = _iterate(sql, compiled, args, batch_size)
+        try:
+            async for rs in rows:
+                if batches:
+                    yield [cls(**r) for r in rs]
+                else:
+                    for r in rs:
+                        yield cls(**r)
+        finally:
+            await rows.aclose()
+
+    @classmethod
+    async def findNumber(cls, selectfield, where=None, args=None, cache=False):
         # 根据WHERE条件查找，但返回的是整数，适用于select count(*)类型的sql
-        sql = ["select %s _num_ from `%s`" % (selectfield, cls.__table__)]
-        if where:
-            sql.append("where")
-            sql.append(where)
-        rs = await select(" ".join(sql), args, 1)
+        def build():
+            sql = ["select %s _num_ from `%s`" % (selectfield, cls.__table__)]
+            if where:
+                sql.append("where")
+                sql.append(where)
+            return " ".join(sql)
+        sql, compiled = cls._statement(("findNumber", selectfield, where), build)
+        if cache:
+            rs = await _cached_select(cls.__table__, sql, compiled, args, 1)
+        else:
+            rs = await _select(sql, compiled, args, 1)
         if len(rs) == 0:
             return None
         return rs[0]["_num_"]
 
     @classmethod
     async def find(cls, pk):
-        rs = await select('%s where `%s`=?' % (cls.__select__, cls.__primary_key__), [pk], 1)
-        if len(rs) == 0:
+        imap = _identity.get()
+        if imap is not None:
+            row = imap.get(cls.__table__, pk)
+            if row is not None:
+                imap.saved += 1
+                return None if row is IdentityMap.MISSING else cls(**row)
+            imap.queries += 1
+        if _loader_options is not None and _tx.get() is None and not _reads_primary():
+            # 批次按普通读请求选择从库，处于读写一致窗口的会话不参与合并，直接查主库
+            # shield: 某个调用者被取消时不能取消其他调用者共享的future
+            row = await asyncio.shield(cls.load(pk))
+        else:
+            sql, compiled = cls.__find__
+            rs = await _select(sql, compiled, [pk], 1)
+            row = rs[0] if rs else None
+        if row is None:
+            if imap is not None:
+                imap.put(cls.__table__, pk, IdentityMap.MISSING)
             return None
-        return cls(**rs[0])  # 返回一条记录，以dict的形式返回，因为cls的父类继承了dict类
+        if imap is not None:
+            imap.put(cls.__table__, pk, row)
+        return cls(**row)  # 返回一条记录，以dict的形式返回，因为cls的父类继承了dict类
+
+    @classmethod
+    def load(cls, pk):
+        # 返回的future由同一批次中相同主键的调用者共享，结果是原始行(dict)或None
+        loader = _loaders.get(cls)
+        if loader is None:
+            loader = _loaders[cls] = BatchLoader(cls, **(_loader_options or {}))
+        return loader.load(pk)
+
+    @classmethod
+    async def _find_many(cls, pks):
+        # IN列表补齐到2的幂，使语句形状的数量有上限，便于语句缓存
+        n = 1
+        while n < len(pks):
+            n *= 2
+        args = list(pks) + [pks[-1]] * (n - len(pks))
+        sql, compiled = cls._statement(("find_many", n),
+                                       lambda: "%s where `%s` in (%s)" % (cls.__select__, cls.__primary_key__, create_args_string(n)))
+        return await _select(sql, compiled, args)
+
+    def _remember(self, row=None):
+        # 写入后保持当前请求的identity map与数据库一致
+        imap = _identity.get()
+        if imap is not None:
+            imap.invalidate(self.__table__)
+            if row is None:
+                row = {k: self.getValue(k) for k in self.__mappings__}
+            imap.put(self.__table__, self.getValue(self.__primary_key__), row)
 
     async def save(self):
         args = list(map(self.getValueOrDefault, self.__fields__))
         args.append(self.getValueOrDefault(self.__primary_key__))
-        rows = await execute(self.__insert__, args)
+        rows = await _execute(*self.__compiled__["insert"], args, self.__table__, pk=args[-1])
+        self._remember()
         if rows != 1:
             logging.warning(f"failed to insert record: affected rows: {rows}" % rows)
 
     async def update(self):
         args = list(map(self.getValue, self.__fields__))
         args.append(self.getValue(self.__primary_key__))
-        rows = await execute(self.__update__, args)
+        rows = await _execute(*self.__compiled__["update"], args, self.__table__, pk=args[-1])
+        self._remember()
         if rows != 1:
             logging.warning(f"failed to update by primary key: affected rows: {rows}" % rows)
 
     async def remove(self):
         args = [self.getValue(self.__primary_key__)]
-        rows = await execute(self.__delete__, args)
+        rows = await _execute(*self.__compiled__["delete"], args, self.__table__, pk=args[0])
+        self._remember(IdentityMap.MISSING)
         if rows != 1:
             logging.warning(f"failed to remove by primary key: affected rows: {rows}" % rows)
 
+    @classmethod
+    def _forget(cls):
+        imap = _identity.get()
+        if imap is not None:
+            imap.invalidate(cls.__table__)
+
+    @classmethod
+    async def save_many(cls, rows):
+        # 批量插入，一次往返完成
+        if not rows:
+            return 0
+        args_list = []
+        for row in rows:
+            args = list(map(row.getValueOrDefault, cls.__fields__))
+            args.append(row.getValueOrDefault(cls.__primary_key__))
+            args_list.append(args)
+        cls._forget()
+        return await _execute_many(*cls.__compiled__["insert"], args_list, cls.__table__)
+
+    @classmethod
+    async def update_many(cls, rows):
+        # 按主键批量更新
+        if not rows:
+            return 0
+        args_list = []
+        for row in rows:
+            args = list(map(row.getValue, cls.__fields__))
+            args.append(row.getValue(cls.__primary_key__))
+            args_list.append(args)
+        cls._forget()
+        return await _execute_many(*cls.__compiled__["update"], args_list, cls.__table__)
+
+    @classmethod
+    async def update_where(cls, set, where, args=None):
+        # 基于集合的更新，如 Comment.update_where("user_name=concat(user_name, ?)", "user_id=?", [suffix, uid])
+        sql, compiled = cls._statement(("update_where", set, where),
+                                       lambda: "update `%s` set %s where %s" % (cls.__table__, set, where))
+        cls._forget()
+        return await _execute(sql, compiled, args or (), cls.__table__)
+
+    @classmethod
+    async def remove_where(cls, where, args=None):
+        sql, compiled = cls._statement(("remove_where", where),
+                                       lambda: "delete from `%s` where %s" % (cls.__table__, where))
+        cls._forget()
+        return await _execute(sql, compiled, args or (), cls.__table__)
+
 
 class Field(object):
 
-    def __init__(self, name, column_type, primary_key, default):
+    def __init__(self, name, column_type, primary_key, default, index=False, unique=False, deferred=False):
         self.name = name
         self.column_type = column_type
         self.primary_key = primary_key
         self.default = default
+        self.index = index or unique  # 单列索引，unique=True时为唯一索引
+        self.unique = unique
+        self.deferred = deferred  # findAll(defer=True)时不读取该列
 
     def __str__(self):
         return f"<{self.__class__.__name__}, {self.column_type}: {self.name}>"
@@ -208,33 +1290,47 @@ class Field(object):
 
 class StringField(Field):
 
-    def __init__(self, name=None, primary_key=False, default=None, ddl="varchar(100)"):
-        super().__init__(name, ddl, primary_key, default)
+    def __init__(self, name=None, primary_key=False, default=None, ddl="varchar(100)", index=False, unique=False):
+        super().__init__(name, ddl, primary_key, default, index, unique)
 
 
 class BooleanField(Field):
 
-    def __init__(self, name=None, default=False):
-        super().__init__(name, 'boolean', False, default)
+    def __init__(self, name=None, default=False, index=False):
+        super().__init__(name, 'boolean', False, default, index)
 
 
 class IntegerField(Field):
 
-    def __init__(self, name=None, primary_key=False, default=0):
-        super().__init__(name, 'bigint', primary_key, default)
+    def __init__(self, name=None, primary_key=False, default=0, index=False, unique=False):
+        super().__init__(name, 'bigint', primary_key, default, index, unique)
 
 
 class FloatField(Field):
 
-    def __init__(self, name=None, primary_key=False, default=0.0):
-        super().__init__(name, 'real', primary_key, default)
+    def __init__(self, name=None, primary_key=False, default=0.0, index=False, unique=False):
+        super().__init__(name, 'real', primary_key, default, index, unique)
 
 
 class TextField(Field):
 
-    def __init__(self, name=None, default=None):
-        super().__init__(name, 'text', False, default)
+    def __init__(self, name=None, default=None, deferred=False):
+        super().__init__(name, 'text', False, default, deferred=deferred)
+
+
+def generate_ddl(*models):
+    return "\n\n".join(m.create_table_sql() for m in models)
+
+def statement_templates():
+    # 当前进程已发出的全部语句模板("?"占位符形式)
+    templates = []
+    for key, value in _statements.items():
+        templates.append(value[0] if isinstance(value, tuple) else key)
+    return templates
 
+async def explain(sql, args=()):
+    # EXPLAIN一条语句模板，返回执行计划的各行
+    return await select("explain " + sql, args)
 
 def create_args_string(num):
     # 用于输出元类中创建sql_insert语句中的占位符
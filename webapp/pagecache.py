@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Output cache for pages rendered to anonymous visitors.
+"""
+import hashlib
+import logging
+import time
+
+import metrics
+from lru import LRUCache
+
+
+class PageEntry(object):
+
+    __slots__ = ('body', 'content_type', 'charset', 'encoding', 'etag', 'tags', 'expires')
+
+    def __init__(self, body, content_type, charset, encoding, tags, expires):
+        self.body = body
+        self.content_type = content_type
+        self.charset = charset
+        self.encoding = encoding  # Content-Encoding，未压缩时为None
+        self.etag = make_etag(body)
+        self.tags = tags
+        self.expires = expires
+
+
+class PageCache(LRUCache):
+    """
+    LRU of rendered page bodies bounded by a byte budget. Entries carry tags such as
+    'blogs' or 'blog:<id>' and are dropped by invalidate(tag). A page rendered while
+    one of its tags was invalidated is not stored.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, ttl=300):
+        super(PageCache, self).__init__(max_bytes=max_bytes)
+        self.ttl = ttl
+        self.invalidations = 0
+        self._tags = dict()  # tag -> set(key)
+        self._generations = dict()  # tag -> 失效次数，用来丢弃失效前开始渲染的页面
+        self._epoch = 0  # 全部清空的次数
+
+    def generation(self, tags):
+        # 渲染前取得，交给put
+        return (self._epoch,) + tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def expired(self, entry):
+        return entry.expires and entry.expires < time.time()
+
+    def sizeof(self, entry):
+        return len(entry.body)
+
+    def removed(self, key, entry):
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key):
+        return self.lookup(key)
+
+    def put(self, key, body, content_type, charset, tags, encoding=None, generation=None):
+        if len(body) > self.max_bytes:
+            return None
+        if generation is not None and generation != self.generation(tags):
+            return None
+        entry = PageEntry(body, content_type, charset, encoding, tuple(tags), time.time() + self.ttl if self.ttl else None)
+        self.add(key, entry)
+        for tag in entry.tags:
+            self._tags.setdefault(tag, set()).add(key)
+        return entry
+
+    def invalidate(self, *tags):
+        # 不带参数时清空全部
+        if not tags:
+            self._epoch += 1
+            self.invalidations += len(self)
+            self.clear()
+            self._tags.clear()
+            return
+        if len(self._generations) > 10000:
+            # 计数表过大时整体重置，递增epoch使正在渲染的页面都不被缓存
+            self._generations.clear()
+            self._epoch += 1
+        for tag in tags:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+            for key in list(self._tags.get(tag, ())):
+                self.invalidations += 1
+                self.discard(key)
+
+    def stats(self):
+        stats = super(PageCache, self).stats()
+        stats.update(ttl=self.ttl, invalidations=self.invalidations)
+        return stats
+
+
+def make_etag(body):
+    return '"%s"' % hashlib.sha1(body).hexdigest()
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return etag in (t.strip() for t in if_none_match.split(','))
+
+
+# 全局的页面缓存，app.init按configs.page_cache配置；API修改数据后调用invalidate
+page_cache = PageCache()
+
+def configure(max_bytes=32 * 1024 * 1024, ttl=300):
+    global page_cache
+    page_cache = PageCache(max_bytes, ttl)
+    logging.info(f"page cache: max_bytes={max_bytes}, ttl={ttl}")
+    return page_cache
+
+_listeners = []
+
+def add_listener(fn):
+    # fn(tags)在本进程的页面缓存失效后调用，多进程部署时由server.py转发给其他工作进程
+    _listeners.append(fn)
+
+def remove_listener(fn):
+    _listeners.remove(fn)
+
+def invalidate(*tags):
+    page_cache.invalidate(*tags)
+    for fn in _listeners:
+        fn(tags)
+
+_m_page_cache = metrics.Counter('page_cache_total', 'Page output cache lookups and removals.', ('result',),
+                                fn=lambda: {(k,): v for k, v in page_cache.stats().items()
+                                            if k in ('hits', 'misses', 'evictions', 'invalidations')})
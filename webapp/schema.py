@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Schema tools driven by the field and index declarations in models.py.
+
+    python schema.py ddl                         print CREATE TABLE statements
+    python schema.py verify [--templates FILE]   EXPLAIN the hot statement templates
+
+verify connects with configs.db, EXPLAINs every statement template the handlers
+issue (plus any templates listed one per line in FILE, e.g. recorded with
+orm.statement_templates() during a load test) and exits with status 1 if a plan
+uses a full table scan or a filesort. Run it against a seeded database: on
+near-empty tables MySQL may prefer a scan even when the index exists.
+"""
+import argparse
+import asyncio
+import logging
+import re
+import sys
+
+import orm
+from config import configs
+from models import User, Blog, Comment
+
+MODELS = (User, Blog, Comment)
+
+
+def hot_queries():
+    # handlers.py中热点查询的语句模板，由ORM自己生成，保证与运行时完全一致
+    queries = [
+        ('index', Blog._prepare_findAll(orderby='created_at desc', limit=(0, 8), defer=True)),
+        ('index (cursor)', Blog._prepare_findAll(seek=('created_at', 'id'), after=[0.0, '0'], limit=9, defer=True)),
+        ('index (cursor first page)', Blog._prepare_findAll(seek=('created_at', 'id'), limit=9, defer=True)),
+        ('index (cursor previous)', Blog._prepare_findAll(seek=('created_at', 'id'), after=[0.0, '0'], desc=False,
+                                                          limit=9, defer=True)),
+        ('get_blog', Blog.__find__ + ([''],)),
+        ('get_blog comments', Comment._prepare_findAll('blog_id=?', [''], orderby='created_at desc')),
+        ('authenticate', User._prepare_findAll('email=?', [''])),
+        ('cookie2user', User.__find__ + ([''],)),
+        ('api_comments (cursor)', Comment._prepare_findAll(seek=('created_at', 'id'), after=[0.0, '0'], limit=9,
+                                                           defer=True)),
+        ('api_get_users (cursor)', User._prepare_findAll(seek=('created_at', 'id'), after=[0.0, '0'], limit=9,
+                                                         defer=True)),
+    ]
+    delete_users = 'update `comments` set user_name=concat(user_name, ?) where user_id=?'
+    queries.append(('api_delete_users', (delete_users, orm.compile_sql(delete_users), ['', ''])))
+    return [(label, sql, args) for label, (sql, _, args) in queries]
+
+def sample_args(sql):
+    # 为记录下来的模板构造参数：limit后面的占位符用整数，其余用字符串
+    args = []
+    for m in re.finditer(r'\?', sql):
+        before = sql[:m.start()].rstrip().lower()
+        args.append(10 if before.endswith('limit') or re.search(r'limit\s+\?\s*,$', before) else '0')
+    return args
+
+def check_plan(plan):
+    problems = []
+    for row in plan:
+        table = row.get('table')
+        if row.get('type') == 'ALL':
+            problems.append(f"full table scan on {table}")
+        if 'filesort' in (row.get('Extra') or ''):
+            problems.append(f"filesort on {table}")
+    return problems
+
+async def verify(templates_file=None):
+    await orm.create_pool(loop=asyncio.get_running_loop(), **configs.db)
+    queries = hot_queries()
+    if templates_file:
+        with open(templates_file) as f:
+            for line in f:
+                sql = line.strip()
+                if sql and not sql.lower().startswith('explain'):
+                    queries.append(('recorded', sql, sample_args(sql)))
+    failed = 0
+    for label, sql, args in queries:
+        try:
+            plan = await orm.explain(sql, args)
+        except Exception as e:
+            print(f"ERROR {label}: {sql}\n    {e}")
+            failed += 1
+            continue
+        problems = check_plan(plan)
+        if problems:
+            failed += 1
+            print(f"FAIL  {label}: {sql}\n    " + "\n    ".join(problems))
+        else:
+            print(f"ok    {label}")
+    print(f"{len(queries)} statements checked, {failed} failed")
+    return failed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='schema tools')
+    sub = parser.add_subparsers(dest='command')
+    sub.add_parser('ddl', help='print CREATE TABLE statements')
+    p = sub.add_parser('verify', help='EXPLAIN statement templates')
+    p.add_argument('--templates', help='file with one statement template per line')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    if args.command == 'ddl':
+        print(orm.generate_ddl(*MODELS))
+    elif args.command == 'verify':
+        sys.exit(1 if asyncio.run(verify(args.templates)) else 0)
+    else:
+        parser.print_help()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+JSON serialization of API responses.
+
+Model instances are dicts and are encoded natively; slotted rows, Page and
+CursorPage use encoders precomputed per type. orjson is used when installed,
+otherwise the standard library json module.
+"""
+import json
+import operator
+
+from apis import Page, CursorPage
+from orm import Row
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 超过这个长度的列表以分块的方式写出
+STREAM_THRESHOLD = 1000
+CHUNK_ITEMS = 200
+
+_encoders = dict()  # 类型 -> 把对象转换成JSON原生类型的函数
+
+
+def register(cls, encoder):
+    # 为某个类型注册编码函数，例如register(Decimal, str)
+    _encoders[cls] = encoder
+
+def _row_encoder(cls):
+    # 按行类型的列预先生成取值函数，避免逐列getattr
+    columns = cls.__columns__
+    getter = operator.attrgetter(*columns)
+    if len(columns) == 1:
+        return lambda o: {columns[0]: getter(o)}
+    return lambda o: dict(zip(columns, getter(o)))
+
+def _default(o):
+    cls = type(o)
+    encoder = _encoders.get(cls)
+    if encoder is None:
+        if issubclass(cls, Row):
+            encoder = _row_encoder(cls)
+        else:
+            for base in cls.__mro__[1:]:
+                if base in _encoders:
+                    encoder = _encoders[base]
+                    break
+            else:
+                # 与原来的default=lambda o: o.__dict__保持一致
+                if not hasattr(o, '__dict__'):
+                    raise TypeError(f"Object of type {cls.__name__} is not JSON serializable")
+                encoder = vars
+        _encoders[cls] = encoder
+    return encoder(o)
+
+register(Page, vars)
+register(CursorPage, vars)
+
+if orjson is not None:
+    def dumps(obj):
+        return orjson.dumps(obj, default=_default)
+else:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_default)
+
+    def dumps(obj):
+        return _encoder.encode(obj).encode('utf-8')
+
+backend = 'orjson' if orjson is not None else 'json'
+
+
+def should_stream(obj):
+    # 顶层dict中含有很长的列表时才分块写出，小响应一次编码更快
+    return isinstance(obj, dict) and any(
+        isinstance(v, (list, tuple)) and len(v) > STREAM_THRESHOLD for v in obj.values())
+
+def iter_chunks(obj, chunk_items=CHUNK_ITEMS):
+    """
+    Yield the JSON encoding of a dict piece by piece, encoding long lists
+    chunk_items elements at a time so the whole body is never held in memory.
+    """
+    yield b'{'
+    for i, (key, value) in enumerate(obj.items()):
+        prefix = (b',' if i else b'') + dumps(str(key)) + b':'
+        if not isinstance(value, (list, tuple)) or len(value) <= chunk_items:
+            yield prefix + dumps(value)
+            continue
+        yield prefix + b'['
+        for start in range(0, len(value), chunk_items):
+            # 每块编码成一个数组，去掉两端的方括号后拼接
+            chunk = dumps(value[start:start + chunk_items])[1:-1]
+            yield (b',' if start else b'') + chunk
+        yield b']'
+    yield b'}'
@@ -0,0 +1,401 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Multi-process server: a supervisor forks configs.server.workers workers, each
+running the app with its own orm pool on a SO_REUSEPORT socket.
+
+    python server.py                 start; app.py stays the single-process server
+    WEBAPP_ENV=production python server.py
+                                     start with config_production.py merged in
+    kill -HUP <supervisor pid>       rolling restart, one worker at a time
+    kill -TERM <supervisor pid>      drain in-flight requests and stop
+
+A crashed worker is restarted after restart_delay seconds, doubling up to a minute
+while it keeps failing before it gets ready. Workers import the app after the
+fork, so a rolling restart picks up changed handler code.
+
+The page, query and session caches live in each worker. Every worker sends its
+invalidations to the supervisor, which relays them to the other workers, so a
+write handled by one worker is visible through all of them.
+"""
+import asyncio
+import json
+import logging
+import os
+import select
+import signal
+import socket
+import sys
+import time
+
+from config import configs
+import logconfig
+
+REUSE_PORT = hasattr(socket, 'SO_REUSEPORT')
+READY_TIMEOUT = 60
+
+
+def make_socket(host, port, reuse_port=REUSE_PORT, backlog=128):
+    family = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0][0]
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        # 每个工作进程绑定自己的socket，由内核在它们之间分配新连接
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+def worker_db_config(db, pool_maxsize=None):
+    # 限制每个工作进程的连接数，自适应扩容的上下界也不超过这个值
+    if not pool_maxsize:
+        return db
+    db = dict(db, maxsize=min(db.get('maxsize', 10), pool_maxsize), minsize=min(db.get('minsize', 1), pool_maxsize))
+    pool = dict(db.get('pool') or {})
+    adaptive = pool.get('adaptive')
+    if adaptive:
+        pool['adaptive'] = dict(adaptive, min=min(adaptive.get('min', 1), pool_maxsize),
+                                max=min(adaptive.get('max', pool_maxsize), pool_maxsize))
+    db['pool'] = pool
+    return db
+
+
+class Invalidations(object):
+    """
+    Worker side of the invalidation relay: sends the table writes and page cache
+    invalidations of this worker to the supervisor and applies the ones it relays
+    from the other workers.
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.channel.setblocking(False)
+        self.sent = 0
+        self.received = 0
+        self._applying = False
+
+    def start(self, loop):
+        import orm
+        import pagecache
+        orm.add_write_listener(self._on_write)
+        pagecache.add_listener(self._on_page)
+        loop.add_reader(self.channel.fileno(), self._receive)
+
+    def _send(self, kind, value):
+        # 应用其他进程转来的失效时不再转发
+        if self._applying:
+            return
+        try:
+            self.channel.send(json.dumps([kind, value]).encode())
+            self.sent += 1
+        except OSError as e:
+            logging.warning(f"failed to relay {kind} invalidation {value}: {e}")
+
+    def _on_write(self, table, pk):
+        self._send('table', [table, pk])
+
+    def _on_page(self, tags):
+        self._send('page', list(tags))
+
+    def _receive(self):
+        import orm
+        import pagecache
+        while True:
+            try:
+                data = self.channel.recv(65536)
+            except BlockingIOError:
+                return
+            if not data:
+                return
+            kind, value = json.loads(data)
+            self.received += 1
+            self._applying = True
+            try:
+                if kind == 'table':
+                    orm.invalidate(*value)
+                elif kind == 'page':
+                    pagecache.invalidate(*value)
+            finally:
+                self._applying = False
+
+
+async def serve(index, sock, ready_fd, channel, options):
+    # 在子进程中导入app，滚动重启时会加载修改后的代码
+    from aiohttp import web
+    import app
+    import orm
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    application = await app.init_app(loop, worker_db_config(configs.db, options.pool_maxsize))
+    Invalidations(channel).start(loop)
+    runner = web.AppRunner(application)
+    await runner.setup()
+    if sock is None:
+        sock = make_socket(options.host, options.port)
+    site = web.SockSite(runner, sock, shutdown_timeout=options.shutdown_timeout)
+    await site.start()
+    os.write(ready_fd, b'1')
+    os.close(ready_fd)
+    logging.info('worker %d (pid %d) serving on http://%s:%s' % (index, os.getpid(), options.host, options.port))
+    await stop.wait()
+    # 先关闭监听socket，再等待处理中的请求完成(最多shutdown_timeout秒)，最后关闭连接池
+    logging.info('worker %d (pid %d) draining' % (index, os.getpid()))
+    await runner.cleanup()
+    await orm.close_pool()
+    logging.info('worker %d (pid %d) stopped' % (index, os.getpid()))
+
+
+class Worker(object):
+
+    def __init__(self, index, pid, ready_fd, channel):
+        self.index = index
+        self.pid = pid
+        self.ready_fd = ready_fd
+        self.channel = channel  # 与该工作进程之间转发缓存失效的socket
+        self.started = time.time()
+        self.ready = False
+        self.starting = True  # 尚未报告就绪，也未退出
+        self.draining = False
+
+    def close(self):
+        os.close(self.ready_fd)
+        self.channel.close()
+
+
+class Supervisor(object):
+    """
+    Forks the workers, restarts the ones that die, relays cache invalidations
+    between them and performs rolling restarts: a replacement is started and must
+    report ready before the old worker is told to drain, so there is always a full
+    set of workers accepting connections.
+    """
+
+    def __init__(self, options):
+        self.options = options
+        self.count = options.workers or os.cpu_count() or 1
+        self.workers = dict()  # pid -> Worker
+        self.failures = dict()  # index -> 连续启动失败次数
+        self.restarts = dict()  # index -> 计划重启的时间
+        self.sock = None
+        self.stopping = False
+        self.reloading = False
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+        if not REUSE_PORT:
+            # 不支持SO_REUSEPORT时由主进程监听，工作进程继承同一个socket
+            self.sock = make_socket(self.options.host, self.options.port, reuse_port=False)
+        logging.info('supervisor %d starting %d workers on %s:%s (SO_REUSEPORT: %s)' % (
+            os.getpid(), self.count, self.options.host, self.options.port, REUSE_PORT))
+        for index in range(self.count):
+            if not self._wait_ready(self.spawn(index)):
+                logging.error('worker %d failed to start, exiting' % index)
+                self.stopping = True
+                break
+        while not self.stopping:
+            if self.reloading:
+                self.reloading = False
+                self.rolling_restart()
+            self.reap()
+            self._restart_due()
+            self._check_starting()
+            self.poll(0.2)
+        self.stop_all()
+
+    def _on_stop(self, signum, frame):
+        self.stopping = True
+
+    def _on_reload(self, signum, frame):
+        self.reloading = True
+
+    def spawn(self, index):
+        r, w = os.pipe()
+        parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        pid = os.fork()
+        if pid == 0:
+            os.close(r)
+            parent.close()
+            for worker in self.workers.values():
+                worker.close()
+            for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+                signal.signal(sig, signal.SIG_DFL)
+            os._exit(self._run_worker(index, w, child))
+        os.close(w)
+        child.close()
+        parent.setblocking(False)
+        worker = Worker(index, pid, r, parent)
+        self.workers[pid] = worker
+        return worker
+
+    def _run_worker(self, index, ready_fd, channel):
+        code = 0
+        try:
+            # 每个工作进程写自己的日志文件，避免多个进程同时轮转同一个文件
+            options = dict(configs.logging)
+            options['file'] = (options.get('file') or logconfig.default_file()) + '.%d' % index
+            logconfig.setup(**options)
+            asyncio.run(serve(index, self.sock, ready_fd, channel, self.options))
+        except BaseException as e:
+            logging.exception(e)
+            code = 1
+        finally:
+            logconfig.shutdown()
+        return code
+
+    def poll(self, timeout):
+        # 等待至多timeout秒：转发工作进程发来的缓存失效，记录启动中的工作进程是否就绪
+        workers = list(self.workers.values())
+        channels = {w.channel.fileno(): w for w in workers}
+        starting = {w.ready_fd: w for w in workers if w.starting}
+        try:
+            readable, _, _ = select.select(list(channels) + list(starting), [], [], timeout)
+        except InterruptedError:
+            return
+        for fd in readable:
+            if fd in starting:
+                worker = starting[fd]
+                # 工作进程启动完成后向管道写入一个字节；进程退出时管道关闭，读到EOF
+                worker.starting = False
+                worker.ready = os.read(fd, 1) == b'1'
+                if worker.ready:
+                    self.failures.pop(worker.index, None)
+            else:
+                self._relay(channels[fd], workers)
+
+    def _relay(self, source, workers):
+        while True:
+            try:
+                data = source.channel.recv(65536)
+            except BlockingIOError:
+                return
+            if not data:
+                return
+            for worker in workers:
+                if worker is source:
+                    continue
+                try:
+                    worker.channel.send(data)
+                except OSError as e:
+                    # 接收方缓冲区已满或已退出；已退出的进程重启后缓存是空的
+                    logging.warning('failed to relay invalidation to worker %d (pid %d): %s' % (
+                        worker.index, worker.pid, e))
+
+    def _wait_ready(self, worker, timeout=READY_TIMEOUT):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            self.poll(0.2)
+            if not worker.starting:
+                return worker.ready
+        return False
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            worker.close()
+            if worker.draining or self.stopping:
+                continue
+            logging.error('worker %d (pid %d) died with status %d after %.1fs' % (
+                worker.index, pid, status, time.time() - worker.started))
+            self.schedule_restart(worker.index, worker.ready)
+
+    def schedule_restart(self, index, was_ready):
+        # 不在这里等待：重启时间到了由主循环启动，期间照常处理信号与其他退出的工作进程
+        failures = 0 if was_ready else self.failures.get(index, 0) + 1
+        self.failures[index] = failures
+        delay = min(self.options.restart_delay * (2 ** failures), 60)
+        self.restarts[index] = time.time() + delay
+        logging.info('restarting worker %d in %.1fs' % (index, delay))
+
+    def _restart_due(self):
+        now = time.time()
+        for index, when in list(self.restarts.items()):
+            if when <= now:
+                del self.restarts[index]
+                self.spawn(index)
+
+    def _check_starting(self):
+        # 超时仍未就绪的工作进程强制结束，退出后按启动失败重启
+        now = time.time()
+        for worker in list(self.workers.values()):
+            if worker.starting and now - worker.started > READY_TIMEOUT:
+                logging.error('worker %d (pid %d) not ready after %ds, killing' % (worker.index, worker.pid, READY_TIMEOUT))
+                worker.starting = False
+                try:
+                    os.kill(worker.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    def rolling_restart(self):
+        logging.info('rolling restart of %d workers' % len(self.workers))
+        for old in list(self.workers.values()):
+            if self.stopping:
+                return
+            if old.pid not in self.workers:
+                continue
+            new = self.spawn(old.index)
+            if not self._wait_ready(new):
+                logging.error('replacement for worker %d failed to start, keeping the old workers' % old.index)
+                return
+            self._stop_worker(old)
+
+    def _stop_worker(self, worker):
+        worker.draining = True
+        try:
+            os.kill(worker.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return
+        self._wait_exit([worker], self.options.shutdown_timeout + 5)
+
+    def _wait_exit(self, workers, timeout):
+        deadline = time.time() + timeout
+        pending = {w.pid: w for w in workers}
+        while pending and time.time() < deadline:
+            for pid in list(pending):
+                try:
+                    done, _ = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    done = pid
+                if done:
+                    worker = pending.pop(pid)
+                    if self.workers.pop(pid, None) is not None:
+                        worker.close()
+            # 等待期间继续转发其他工作进程的缓存失效
+            self.poll(0.1)
+        for pid in pending:
+            # 超时仍未退出的强制结束
+            logging.warning('worker %d (pid %d) did not drain in time, killing' % (pending[pid].index, pid))
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            if self.workers.pop(pid, None) is not None:
+                pending[pid].close()
+
+    def stop_all(self):
+        logging.info('stopping %d workers' % len(self.workers))
+        self.restarts.clear()
+        workers = list(self.workers.values())
+        for worker in workers:
+            worker.draining = True
+            try:
+                os.kill(worker.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        self._wait_exit(workers, self.options.shutdown_timeout + 5)
+
+
+if __name__ == '__main__':
+    logconfig.setup(**configs.logging)
+    Supervisor(configs.server).run()
+    sys.exit(0)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Cache of verified session cookies, so cookie2user does not load the user and
+recompute the signature on every request.
+"""
+import logging
+import time
+
+import metrics
+import orm
+from lru import LRUCache
+from models import User
+
+
+class SessionCache(LRUCache):
+    """
+    LRU of cookie value -> verified user. An entry lives until the cookie expires or
+    ttl seconds pass; invalid cookies are remembered as None for negative_ttl seconds.
+    Entries are indexed by user id, so a write to one user only evicts that user's
+    cookies; writes to the users table that are not by primary key clear the cache.
+    """
+
+    def __init__(self, maxsize=10000, ttl=60, negative_ttl=30):
+        super(SessionCache, self).__init__(maxsize)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.negative_hits = 0
+        self.invalidations = 0
+        self.generation = 0  # 每次失效加一，查库期间发生的失效不会被之后的put覆盖
+        self._uids = dict()  # uid -> set(cookie)
+
+    def expired(self, entry):
+        return entry[1] < time.time()
+
+    def removed(self, cookie, entry):
+        uid = _uid_of(cookie)
+        cookies = self._uids.get(uid)
+        if cookies is not None:
+            cookies.discard(cookie)
+            if not cookies:
+                del self._uids[uid]
+
+    def get(self, cookie):
+        # 返回(是否命中, user)，命中的无效cookie返回(True, None)；hits包含negative_hits
+        entry = self.lookup(cookie)
+        if entry is None:
+            return False, None
+        user = entry[0]
+        if user is None:
+            self.negative_hits += 1
+            return True, None
+        # 返回副本，请求中对request.__user__的修改不会影响缓存
+        return True, user.__class__(**user)
+
+    def put(self, cookie, user, expires, generation):
+        if generation != self.generation:
+            return
+        now = time.time()
+        if user is None:
+            until = now + self.negative_ttl
+        else:
+            until = min(expires, now + self.ttl)
+        self.add(cookie, (user, until))  # (user或None, 过期时间)
+        self._uids.setdefault(_uid_of(cookie), set()).add(cookie)
+
+    def evict(self, uid):
+        # 只移除该用户的cookie，包括以该uid开头的无效cookie
+        self.generation += 1
+        for cookie in list(self._uids.get(uid, ())):
+            self.invalidations += 1
+            self.discard(cookie)
+
+    def clear(self):
+        self.generation += 1
+        self.invalidations += len(self)
+        super(SessionCache, self).clear()
+        self._uids.clear()
+
+    def stats(self):
+        stats = super(SessionCache, self).stats()
+        stats.update(negative_hits=self.negative_hits, invalidations=self.invalidations)
+        return stats
+
+
+def _uid_of(cookie):
+    # cookie的格式为"uid-expires-sha1"
+    return cookie.split('-', 1)[0]
+
+
+# 全局的会话缓存，app.init按configs.session.cache配置；None表示关闭
+session_cache = SessionCache()
+
+def configure(**kw):
+    global session_cache
+    session_cache = SessionCache(**kw) if kw else None
+    logging.info(f"session cache: {kw or 'off'}")
+    return session_cache
+
+def invalidate(uid=None):
+    # 指定uid时只移除该用户的会话，否则清空
+    if session_cache is None:
+        return
+    if uid is None:
+        session_cache.clear()
+    else:
+        session_cache.evict(uid)
+
+def _on_write(table, pk):
+    # 删除用户、修改密码或管理员标志都是对users表中某一行的写入，只移除该用户的会话；
+    # 不按主键的写入与无法确定表名的SQL清空全部
+    if table is None or table == User.__table__:
+        invalidate(pk)
+
+orm.add_write_listener(_on_write)
+
+_m_session_cache = metrics.Counter('session_cache_total', 'Session cookie verification cache lookups.', ('result',),
+                                   fn=lambda: {(k,): v for k, v in (session_cache.stats() if session_cache else {}).items()
+                                               if k in ('hits', 'negative_hits', 'misses', 'invalidations')})
+_m_session_ratio = metrics.Gauge('session_cache_hit_ratio', 'Fraction of session lookups served from the cache.',
+                                 fn=lambda: session_cache.stats()['hit_ratio'] if session_cache else 0.0)
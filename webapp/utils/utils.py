@@ -3,8 +3,12 @@
 import time
 import hashlib
 import logging
+import functools
 import re
 
+import markdown
+
+import sessioncache
 from models import User
 from apis import APIPermissionError
 from config import configs
@@ -49,26 +53,48 @@ def text2html(text):
                 filter(lambda s: s.strip() != "", text.split("\n")))
     return "".join(lines)
 
+# markdown转HTML
+# 渲染结果按内容缓存，同一内容只渲染一次；新写入的日志和评论在保存时就把结果存入html_content列
+@functools.lru_cache(maxsize=512)
+def render_markdown(text):
+    return markdown.markdown(text or "")
+
 # 解密cookie
+# 验证过的cookie放入会话缓存，缓存期内不再查库、不再计算sha1；无效的cookie也会缓存一段时间
 async def cookie2user(cookie_str):
     if not cookie_str:
         return None
+    cache = sessioncache.session_cache
+    generation = None
+    if cache is not None:
+        hit, user = cache.get(cookie_str)
+        if hit:
+            return user
+        generation = cache.generation
     try:
         L = cookie_str.split("-")
         if len(L) != 3:
+            _remember(cache, generation, cookie_str, None)
             return None
         uid, expires, sha1 = L
         if int(expires) < time.time():
             return None
         user = await User.find(uid)
         if user is None:
+            _remember(cache, generation, cookie_str, None)
             return None
         s = f"{uid}-{user.passwd}-{expires}-{_COOKIE_KEY}"
         if sha1 != hashlib.sha1(s.encode("utf-8")).hexdigest():
             logging.info("invalid sha1")
+            _remember(cache, generation, cookie_str, None)
             return None
         user.passwd = "******"
+        _remember(cache, generation, cookie_str, user, int(expires))
         return user
     except Exception as e:
         logging.exception(e)
-        return None
\ No newline at end of file
+        return None
+
+def _remember(cache, generation, cookie_str, user, expires=0):
+    if cache is not None:
+        cache.put(cookie_str, user.__class__(**user) if user is not None else None, expires, generation)